@@ -0,0 +1,168 @@
+from collections.abc import Hashable
+from sqlalchemy import bindparam
+from sqlmodel import Session, col, or_, select, update
+import uuid
+
+from app import models, settlement, helper
+
+# Member balances are stored in cents in member.balance_cents and maintained
+# incrementally: every expense write applies the difference between the old
+# and the new split of the expense to the affected members, in the same
+# transaction. Reading the balances of a project is then O(members).
+
+def project_member_ids(project_id: uuid.UUID, session: Session) -> list[uuid.UUID]:
+    return list(session.exec(
+        select(models.Member.id).where(
+            models.Member.project_id == project_id,
+        )
+    ).all())
+
+def expense_contributions(
+        expense_id: uuid.UUID,
+        amount: float | None,
+        payer_id: uuid.UUID,
+        involved_ids: list[uuid.UUID],
+        member_ids: list[uuid.UUID]) -> dict[Hashable, int]:
+
+    # Net effect of a single expense on the balances in cents: the payer
+    # gets the amount, the involved members (or everybody) owe their share
+    amount_cents = settlement.to_cents(amount)
+    contributions = {payer_id: amount_cents}
+    for member_id, share in settlement.split(amount_cents, involved_ids or member_ids, expense_id.int):
+        contributions[member_id] = contributions.get(member_id, 0) - share
+    return contributions
+
+def apply_deltas(deltas: dict[Hashable, int], project_id: uuid.UUID, session: Session):
+    params = [
+        {"b_id": member_id, "b_delta": delta}
+        for member_id, delta in deltas.items() if delta
+    ]
+    if not params:
+        return
+
+    # One executemany UPDATE, relative to the stored value
+    member = models.Member.__table__
+    session.connection().execute(
+        update(member).where(
+            member.c.id == bindparam("b_id"),
+            member.c.project_id == project_id,
+        ).values(balance_cents=member.c.balance_cents + bindparam("b_delta")),
+        params,
+    )
+
+def diff(old: dict[Hashable, int], new: dict[Hashable, int]) -> dict[Hashable, int]:
+    return {
+        member_id: new.get(member_id, 0) - old.get(member_id, 0)
+        for member_id in old.keys() | new.keys()
+    }
+
+class ExpenseBalance:
+    # Captures the contributions of an expense before a write, so the
+    # difference can be applied after it. Pass None as the old expense on
+    # create, and as the new expense on delete:
+    #
+    #   tracker = ExpenseBalance(expense, project_id, session)
+    #   ... modify or delete the expense ...
+    #   tracker.apply(expense, session)
+    def __init__(self, expense: models.Expense | None, project_id: uuid.UUID, session: Session):
+        self.project_id = project_id
+        self._member_ids: list[uuid.UUID] | None = None
+        self.old = self.contributions(expense, session) if expense else {}
+
+    def member_ids(self, session: Session) -> list[uuid.UUID]:
+        if self._member_ids is None:
+            self._member_ids = project_member_ids(self.project_id, session)
+        return self._member_ids
+
+    def contributions(self, expense: models.Expense, session: Session) -> dict[Hashable, int]:
+        involved_ids = [member.id for member in expense.involved_members]
+        # The members of the project are only needed for expenses split
+        # over everybody
+        member_ids = [] if involved_ids else self.member_ids(session)
+        return expense_contributions(
+            expense.id, expense.amount, expense.member_id, involved_ids, member_ids)
+
+    def apply(self, expense: models.Expense | None, session: Session):
+        new = self.contributions(expense, session) if expense else {}
+        apply_deltas(diff(self.old, new), self.project_id, session)
+
+def member_addition_deltas(member_id: uuid.UUID, project_id: uuid.UUID, session: Session) -> dict[Hashable, int]:
+    # Balance changes when a member is added: only the expenses split over
+    # everybody get another share. Read before the member is added
+    member_ids = project_member_ids(project_id, session)
+    link = models.ExpenseMemberLink
+    expenses = session.exec(
+        select(models.Expense.id, models.Expense.member_id, models.Expense.amount).where(
+            models.Expense.project_id == project_id,
+            ~select(link.expense_id).where(link.expense_id == models.Expense.id).exists(),
+        )
+    ).all()
+
+    deltas: dict[Hashable, int] = {}
+    for expense_id, payer_id, amount in expenses:
+        old = expense_contributions(expense_id, amount, payer_id, [], member_ids)
+        new = expense_contributions(expense_id, amount, payer_id, [], [*member_ids, member_id])
+        for id, delta in diff(old, new).items():
+            deltas[id] = deltas.get(id, 0) + delta
+    return deltas
+
+def member_removal_deltas(member_id: uuid.UUID, project_id: uuid.UUID, session: Session) -> dict[Hashable, int]:
+    # Balance changes of the other members when a member is removed: the
+    # expenses it paid are gone, and the expenses it was involved in or that
+    # are split over everybody are split over fewer members. Only these
+    # expenses are read, as plain rows, before the member is deleted
+    member_ids = project_member_ids(project_id, session)
+    if member_id not in member_ids:
+        return {}
+    remaining_ids = [id for id in member_ids if id != member_id]
+
+    # The subqueries must not correlate with the links read below
+    link = models.ExpenseMemberLink
+    affected = (
+        models.Expense.project_id == project_id,
+        or_(
+            models.Expense.member_id == member_id,
+            col(models.Expense.id).in_(select(link.expense_id).where(link.member_id == member_id).correlate(None)),
+            ~select(link.expense_id).where(link.expense_id == models.Expense.id).correlate_except(link).exists(),
+        ),
+    )
+    expenses = session.exec(
+        select(models.Expense.id, models.Expense.member_id, models.Expense.amount).where(*affected)
+    ).all()
+    involved: dict[uuid.UUID, list[uuid.UUID]] = {}
+    for expense_id, involved_id in session.exec(
+            select(link.expense_id, link.member_id).join(
+                models.Expense, models.Expense.id == link.expense_id).where(*affected)):
+        involved.setdefault(expense_id, []).append(involved_id)
+
+    deltas: dict[Hashable, int] = {}
+    for expense_id, payer_id, amount in expenses:
+        involved_ids = involved.get(expense_id, [])
+        old = expense_contributions(expense_id, amount, payer_id, involved_ids, member_ids)
+        new = {} if payer_id == member_id else expense_contributions(
+            expense_id, amount, payer_id, [id for id in involved_ids if id != member_id], remaining_ids)
+        for id, delta in diff(old, new).items():
+            deltas[id] = deltas.get(id, 0) + delta
+    deltas.pop(member_id, None)
+    return deltas
+
+def recompute_project_balances(project_id: uuid.UUID, session: Session, repair: bool = False) -> dict[Hashable, tuple[int, int]]:
+    # Recalculate the balances of a project from scratch and compare them
+    # with the stored ones. Returns the drifted members with their
+    # (stored, actual) balance in cents, and writes the actual balances
+    # if repair is set.
+    session.flush()
+    project = helper.get_project_or_404(project_id, session)
+    # Like the deltas, without spreading the cents of left out shares,
+    # which the settlement does when it reads the balances
+    actual = {member_id: paid - owed for member_id, paid, owed in helper.settlement_entries(project)}
+
+    drift = {}
+    for member in project.members:
+        stored = member.balance_cents
+        if stored != actual[member.id]:
+            drift[member.id] = (stored, actual[member.id])
+            if repair:
+                member.balance_cents = actual[member.id]
+                session.add(member)
+    return drift
@@ -0,0 +1,143 @@
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import inspect
+from sqlmodel import Session
+import os
+import uuid
+
+from app import models, balances, helper
+
+# Apply an ordered list of member and expense operations to a project in a
+# single transaction. All changes go through the session and are written
+# with one flush, which batches the INSERTs and UPDATEs per table.
+
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", 500))
+
+class Batch:
+    def __init__(self, project: models.Project):
+        self.project = project
+        self.members = {member.id: member for member in project.members}
+        self.expenses = {
+            expense.id: expense
+            for member in project.members for expense in member.expenses
+        }
+        # Temporary ids of created entries
+        self.ids: dict[str, uuid.UUID] = {}
+
+    def resolve(self, reference: str | None) -> uuid.UUID:
+        if reference is None:
+            raise HTTPException(status_code=422, detail="Missing id")
+        if reference in self.ids:
+            return self.ids[reference]
+        try:
+            return uuid.UUID(reference)
+        except ValueError:
+            raise HTTPException(status_code=404, detail=f"Unknown id '{reference}'")
+
+    def member(self, reference: str | None) -> models.Member:
+        member = self.members.get(self.resolve(reference))
+        if not member:
+            raise HTTPException(status_code=404, detail="Member not found")
+        return member
+
+    def expense(self, reference: str | None, member: models.Member) -> models.Expense:
+        expense = self.expenses.get(self.resolve(reference))
+        if not expense or expense.member_id != member.id:
+            raise HTTPException(status_code=404, detail="Expense not found")
+        return expense
+
+    def expense_data(self, data: dict, model: type[models.ExpenseCreate] | type[models.ExpenseUpdate]) -> dict:
+        # Resolve temporary ids before the validation, then replace the ids
+        # with the members. Only members of this project can be involved
+        data = dict(data)
+        if isinstance(data.get("involved_members"), list):
+            data["involved_members"] = [self.resolve(str(reference)) for reference in data["involved_members"]]
+
+        data = model.model_validate(data).model_dump(exclude_unset=True)
+        if data.get("involved_members") is not None:
+            data["involved_members"] = [self.member(str(member_id)) for member_id in data["involved_members"]]
+        return data
+
+    def apply(self, operation: models.BatchOperation, session: Session):
+        match operation.type, operation.op:
+            case "member", "create":
+                data = models.MemberCreate.model_validate(operation.data).model_dump()
+                member = models.Member(**data, project_id=self.project.id)
+                session.add(member)
+                self.members[member.id] = member
+                if operation.id:
+                    self.ids[operation.id] = member.id
+
+            case "member", "update":
+                member = self.member(operation.id)
+                update = models.MemberUpdate.model_validate(operation.data).model_dump(exclude_unset=True)
+                for key, value in update.items():
+                    setattr(member, key, value)
+
+            case "member", "delete":
+                # Deletes the expenses of the member as well
+                member = self.members.pop(self.member(operation.id).id)
+                for expense in member.expenses:
+                    self.expenses.pop(expense.id, None)
+                for expense in self.expenses.values():
+                    if member in expense.involved_members:
+                        expense.involved_members.remove(member)
+                self.remove(member, session)
+
+            case "expense", "create":
+                payer = self.member(operation.member_id)
+                data = self.expense_data(operation.data, models.ExpenseCreate)
+                expense = models.Expense(**data, project_id=self.project.id, member_id=payer.id, member=payer)
+                session.add(expense)
+                self.expenses[expense.id] = expense
+                if operation.id:
+                    self.ids[operation.id] = expense.id
+
+            case "expense", "update":
+                expense = self.expense(operation.id, self.member(operation.member_id))
+                update = self.expense_data(operation.data, models.ExpenseUpdate)
+                for key, value in update.items():
+                    setattr(expense, key, value)
+
+            case "expense", "delete":
+                payer = self.member(operation.member_id)
+                expense = self.expense(operation.id, payer)
+                self.expenses.pop(expense.id)
+                payer.expenses.remove(expense)
+                self.remove(expense, session)
+
+    def remove(self, entry: models.Member | models.Expense, session: Session):
+        # Entries created earlier in the same batch aren't in the database yet
+        if inspect(entry).pending:
+            session.expunge(entry)
+        else:
+            session.delete(entry)
+
+def apply_batch(session: Session, project_id: uuid.UUID, request: models.BatchRequest) -> models.BatchResult:
+    if len(request.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=413, detail=f"Too many operations, at most {BATCH_MAX_OPERATIONS} per batch")
+
+    batch = Batch(helper.get_project_or_404(project_id, session))
+    for index, operation in enumerate(request.operations):
+        try:
+            batch.apply(operation, session)
+        except ValidationError as error:
+            raise HTTPException(status_code=422, detail=f"Operation {index}: {error}")
+        except HTTPException as error:
+            raise HTTPException(status_code=error.status_code, detail=f"Operation {index}: {error.detail}")
+
+    # Write everything at once, then reload the project graph, as the
+    # collections in the session don't reflect all changes
+    session.flush()
+    session.expire_all()
+    balances.recompute_project_balances(project_id, session, repair=True)
+    helper.bump_project_version(project_id, session)
+
+    project = helper.get_project_or_404(project_id, session)
+    project_public = models.ProjectPublic.model_validate(project)
+    if request.calculate:
+        project_public.payments = helper.calculate_project_payments(project, request.calculate == "optimal")
+
+    session.commit()
+    return models.BatchResult(project=project_public, ids=batch.ids)
@@ -0,0 +1,211 @@
+from collections.abc import AsyncIterator, Iterator
+from fastapi import HTTPException
+from itertools import groupby
+from pydantic import ValidationError
+from sqlmodel import Session, func, insert, select
+import codecs
+import csv
+import io
+import json
+import os
+import uuid
+import uuid6
+
+from app import models, balances, helper, ordering
+from app.database import engine
+
+# Bulk import and export of the expenses of a project, as CSV or NDJSON.
+# Every record is a single line. In CSV, the involved members are joined
+# by semicolons:
+#
+#   payer,amount,name,order,involved_members
+#   <member id or name>,12.5,Pizza,,<member id or name>;<member id or name>
+
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 10000))
+
+CSV_FIELDS = ["payer", "amount", "name", "order", "involved_members"]
+
+def is_csv(content_type: str | None) -> bool:
+    return (content_type or "").split(";")[0].strip() in ("text/csv", "application/csv")
+
+async def read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Split the streamed body into lines, without reading it as a whole.
+    # The incremental decoder handles characters split between chunks
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in stream:
+        try:
+            buffer += decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=422, detail="The body must be UTF-8 encoded")
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.removesuffix("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.removesuffix("\r")
+
+async def parse_expenses(stream: AsyncIterator[bytes], content_type: str | None) -> list[models.ExpenseImport]:
+    rows = []
+    header = None
+    line_number = 0
+
+    async for line in read_lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            if is_csv(content_type):
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = values
+                    continue
+                record = dict(zip(header, values))
+                record["involved_members"] = [
+                    member.strip() for member in record.get("involved_members", "").split(";") if member.strip()
+                ]
+                # Empty CSV cells are missing values
+                record = {key: value for key, value in record.items() if value != ""}
+            else:
+                record = json.loads(line)
+            rows.append(models.ExpenseImport.model_validate(record))
+        except (ValueError, ValidationError) as error:
+            raise HTTPException(status_code=422, detail=f"Invalid expense on line {line_number}: {error}")
+
+        if len(rows) > IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Too many expenses, at most {IMPORT_MAX_ROWS} per import")
+    return rows
+
+def member_resolver(project_id: uuid.UUID, session: Session):
+    # Members are referenced by id or by their (unique) name, resolved
+    # against a single query of the project's members
+    members = session.exec(
+        select(models.Member.id, models.Member.name).where(
+            models.Member.project_id == project_id,
+        )
+    ).all()
+
+    by_reference: dict[str, uuid.UUID | None] = {}
+    for member_id, name in members:
+        by_reference[str(member_id)] = member_id
+        by_reference[member_id.hex] = member_id
+        if name:
+            # Ambiguous names resolve to None
+            by_reference[name] = None if name in by_reference else member_id
+
+    def resolve(reference: str, row: int) -> uuid.UUID:
+        member_id = by_reference.get(reference)
+        if member_id is None:
+            raise HTTPException(status_code=422, detail=f"Unknown or ambiguous member '{reference}' in expense {row}")
+        return member_id
+
+    return resolve, [member_id for member_id, _ in members]
+
+def import_expenses(session: Session, project_id: uuid.UUID, rows: list[models.ExpenseImport]) -> int:
+    helper.get_project_version_or_404(project_id, session)
+    resolve, member_ids = member_resolver(project_id, session)
+
+    # Append to the existing expenses
+    last_order = session.exec(
+        select(func.max(models.Expense.order)).where(
+            models.Expense.project_id == project_id,
+        )
+    ).first()
+    first_order = last_order + 1 if last_order is not None else 0
+    # Expenses without an order go after the last expense of their payer
+    last_keys = dict(session.exec(
+        select(models.Expense.member_id, func.max(models.Expense.order_key)).where(
+            models.Expense.project_id == project_id,
+        ).group_by(models.Expense.member_id)
+    ).all())
+
+    expenses = []
+    links = []
+    deltas: dict[uuid.UUID, int] = {}
+    for index, row in enumerate(rows, start=1):
+        expense_id = uuid6.uuid7()
+        payer_id = resolve(row.payer, index)
+        involved_ids = list(dict.fromkeys(resolve(member, index) for member in row.involved_members))
+
+        if row.order is not None:
+            order = row.order
+            order_key = ordering.index_key(order)
+        else:
+            order = first_order + index - 1
+            # Chained after the last key of the payer, so repeated imports
+            # keep the keys short
+            order_key = ordering.key_between(last_keys.get(payer_id), None)
+        last_keys[payer_id] = max(last_keys.get(payer_id) or "", order_key)
+        expenses.append({
+            "id": expense_id,
+            "project_id": project_id,
+            "member_id": payer_id,
+            "amount": row.amount,
+            "name": row.name,
+            "order": order,
+            "order_key": order_key,
+        })
+        links.extend({"expense_id": expense_id, "member_id": member_id} for member_id in involved_ids)
+
+        contributions = balances.expense_contributions(
+            expense_id, row.amount, payer_id, involved_ids, member_ids)
+        for member_id, contribution in contributions.items():
+            deltas[member_id] = deltas.get(member_id, 0) + contribution
+
+    # Multi-row INSERTs within the transaction of the request
+    if expenses:
+        session.exec(insert(models.Expense), params=expenses)
+    if links:
+        session.exec(insert(models.ExpenseMemberLink), params=links)
+    balances.apply_deltas(deltas, project_id, session)
+    helper.bump_project_version(project_id, session)
+    session.commit()
+    return len(expenses)
+
+def export_expenses(project_id: uuid.UUID, format: str) -> Iterator[str]:
+    # One query for the expenses with their involved members, ordered by
+    # expense, so the rows can be written while they are read. The response
+    # outlives the request session, so use an own one
+    statement = select(
+        models.Expense.id,
+        models.Expense.member_id,
+        models.Expense.amount,
+        models.Expense.name,
+        models.Expense.order,
+        models.ExpenseMemberLink.member_id,
+    ).outerjoin(
+        models.ExpenseMemberLink,
+        models.ExpenseMemberLink.expense_id == models.Expense.id,
+    ).where(
+        models.Expense.project_id == project_id,
+    ).order_by(
+        models.Expense.order_key, models.Expense.id,
+    ).execution_options(yield_per=1000)
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+
+    def csv_line(values: list) -> str:
+        output.seek(0)
+        output.truncate()
+        writer.writerow(values)
+        return output.getvalue()
+
+    if format == "csv":
+        yield csv_line(CSV_FIELDS)
+
+    with Session(engine) as session:
+        rows = session.exec(statement)
+        for (_, payer_id, amount, name, order), links in groupby(rows, key=lambda row: tuple(row[:5])):
+            involved = [str(row[5]) for row in links if row[5] is not None]
+            if format == "csv":
+                yield csv_line([payer_id, amount, name, order, ";".join(involved)])
+            else:
+                yield json.dumps({
+                    "payer": str(payer_id),
+                    "amount": amount,
+                    "name": name,
+                    "order": order,
+                    "involved_members": involved,
+                }) + "\n"
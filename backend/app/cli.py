@@ -0,0 +1,81 @@
+from sqlmodel import Session, select
+import argparse
+import sys
+
+from app.database import engine
+from app import models, balances, helper, retention, settlement
+
+# Maintenance commands, run with: python -m app.cli <command>
+
+def verify_balances(args: argparse.Namespace) -> int:
+    with Session(engine) as session:
+        project_ids = session.exec(select(models.Project.id)).all()
+
+    drifted = 0
+    for project_id in project_ids:
+        # One short transaction per project
+        with Session(engine) as session:
+            drift = balances.recompute_project_balances(project_id, session, repair=args.repair)
+            if args.repair and drift:
+                # New version, so cached settlements and ETags don't serve
+                # the old payments
+                helper.bump_project_version(project_id, session)
+                session.commit()
+
+        for member_id, (stored, actual) in drift.items():
+            print(f"project {project_id} member {member_id}: "
+                  f"stored {settlement.from_cents(stored):.2f}, "
+                  f"actual {settlement.from_cents(actual):.2f}")
+        drifted += len(drift)
+
+    action = "repaired" if args.repair else "found"
+    print(f"Checked {len(project_ids)} projects, {action} {drifted} drifted balances")
+    return 1 if drifted and not args.repair else 0
+
+def purge(args: argparse.Namespace) -> int:
+    if args.days <= 0:
+        print("Set the retention with --days or RETENTION_DAYS")
+        return 1
+
+    report = retention.purge_stale_projects(
+        days=args.days, archive=args.archive, batch_size=args.batch_size,
+        pause=args.pause, dry_run=args.dry_run)
+
+    if args.dry_run:
+        print(f"Found {report.projects} projects not updated for {args.days} days")
+    else:
+        action = "archived" if args.archive else "deleted"
+        print(f"{action.capitalize()} {report.projects} projects with {report.rows} rows "
+              f"in {report.seconds:.1f}s ({report.rows_per_second:.0f} rows/s)")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_balances = commands.add_parser(
+        "verify-balances", help="recompute all member balances and report drift")
+    parser_balances.add_argument(
+        "--repair", action="store_true", help="store the recomputed balances")
+    parser_balances.set_defaults(func=verify_balances)
+
+    parser_purge = commands.add_parser(
+        "purge", help="delete or archive projects not updated for a while")
+    parser_purge.add_argument(
+        "--days", type=int, default=retention.RETENTION_DAYS, help="retention in days")
+    parser_purge.add_argument(
+        "--archive", action="store_true", default=retention.RETENTION_ARCHIVE,
+        help="move the projects to the archive tables instead of deleting them")
+    parser_purge.add_argument(
+        "--batch-size", type=int, default=retention.RETENTION_BATCH_SIZE, help="projects per transaction")
+    parser_purge.add_argument(
+        "--pause", type=float, default=retention.RETENTION_BATCH_PAUSE, help="seconds between batches")
+    parser_purge.add_argument(
+        "--dry-run", action="store_true", help="only count the stale projects")
+    parser_purge.set_defaults(func=purge)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
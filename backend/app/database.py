@@ -1,5 +1,20 @@
+from collections.abc import Callable
+from typing import Any, TypeVar
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+import logging
 import os
+import threading
+import time
+
+from app.timing import request_timings
+
+T = TypeVar("T")
 
 # Define the database URL
 sqlite_path = f"sqlite:///database.db"
@@ -7,11 +22,178 @@ sqlite_path = f"sqlite:///database.db"
 # Define the database url from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL") or sqlite_path
 
+def env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+# Opt-in async mode: route handlers use an AsyncSession on an async driver
+# instead of running blocking sessions in the threadpool
+DATABASE_ASYNC = env_flag("DATABASE_ASYNC")
+
+# Connection pool settings. Connections are recycled before MariaDB's
+# wait_timeout closes them, so the ping on every checkout is opt-in
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))
+POOL_PRE_PING = env_flag("DATABASE_POOL_PRE_PING")
+
+# SQLite tuning, applied to every new connection
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+# Async drivers replacing the sync ones, if no ASYNC_DATABASE_URL is given
+async_drivers = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+def get_async_url(url: str):
+    url_object = make_url(url)
+    return url_object.set(drivername=async_drivers.get(url_object.drivername, url_object.drivername))
+
+class PoolMetrics:
+    # Checkout counters, including the time spent waiting for a connection
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+pool_metrics = PoolMetrics()
+
+class TimedPoolMixin:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.record(time.perf_counter() - start)
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+# Queries taking longer are logged with their statement and parameters,
+# 0 disables the log
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", 0.5))
+slow_query_logger = logging.getLogger("app.slow_query")
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_start
+
+    timings = request_timings.get()
+    if timings is not None:
+        timings.queries += 1
+        timings.add("db", elapsed)
+
+    if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS:
+        slow_query_logger.warning("Slow query (%.3fs): %s %r", elapsed, statement, parameters)
+
+def engine_options(url, poolclass) -> dict[str, Any]:
+    # In-memory SQLite databases live in a single connection, so they keep
+    # SQLAlchemy's default pool
+    url_object = make_url(url)
+    if url_object.get_backend_name() == "sqlite" and url_object.database in (None, "", ":memory:"):
+        return {}
+
+    return {
+        "poolclass": poolclass,
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+def set_sqlite_pragmas(dbapi_connection, _):
+    # WAL lets readers continue while a writer is active, and the busy
+    # timeout makes concurrent writers wait for the lock instead of failing.
+    # Foreign keys are off by default, they are needed for ON DELETE CASCADE
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
 # Create the database engine
 engine = create_engine(DATABASE_URL, echo=False,
-                       pool_pre_ping=True, pool_recycle=60)
+                       **engine_options(DATABASE_URL, TimedQueuePool))
+
+def instrument(sync_engine):
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", set_sqlite_pragmas)
+    # Query counts and times of the requests, see metrics.py
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+def create_async_database_engine(url) -> AsyncEngine:
+    async_engine = create_async_engine(url, echo=False, **engine_options(url, TimedAsyncAdaptedQueuePool))
+    instrument(async_engine.sync_engine)
+    return async_engine
+
+instrument(engine)
+
+# Create the async database engine, only in async mode, as it needs the
+# optional async drivers
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_url(DATABASE_URL)
+async_engine = create_async_database_engine(ASYNC_DATABASE_URL) if DATABASE_ASYNC else None
+
+def pool_stats() -> dict[str, Any]:
+    pool = (async_engine.sync_engine if async_engine else engine).pool
+    stats = {
+        "checkouts": pool_metrics.checkouts,
+        "wait_seconds": pool_metrics.wait_seconds,
+        "max_wait_seconds": pool_metrics.max_wait_seconds,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return stats
+
+# Alembic configuration next to the app package, missing in setups without
+# migrations
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+def schema_at_head() -> bool:
+    # Compare the revision stamped in the database with the head of the
+    # migration scripts, which is one query instead of checking every table
+    if not os.path.exists(ALEMBIC_INI):
+        return False
+
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    with engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+    return current == heads
 
 def init_db():
+    # Databases migrated by Alembic already have the complete schema
+    if schema_at_head():
+        return
     SQLModel.metadata.create_all(engine)
 
 def get_session():
@@ -20,3 +202,31 @@ def get_session():
 
 def get_metadata():
     return SQLModel.metadata
+
+class Database:
+    # Handle for async route handlers to run blocking session code. The
+    # function gets the session as first argument and runs either on the
+    # async engine via AsyncSession.run_sync (no thread involved) or in the
+    # threadpool with a sync session.
+    #
+    # The session isn't usable after the function returned, so it has to
+    # return fully loaded data, e.g. validated public models.
+    def __init__(self, session: Session | AsyncSession):
+        self.session = session
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if isinstance(self.session, AsyncSession):
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+async def get_db():
+    if async_engine:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield Database(session)
+    else:
+        session = Session(engine)
+        try:
+            yield Database(session)
+        finally:
+            # Closing returns the connection to the pool, which may block
+            await run_in_threadpool(session.close)
@@ -0,0 +1,54 @@
+from fastapi import HTTPException, Request, Response
+from sqlmodel import Session
+import hashlib
+import os
+import uuid
+
+from app import helper, models, readmodel
+from app.database import engine
+
+# The demo project can't be changed through the API (see middlewares.py),
+# so its responses are built once at startup and served from memory. After
+# changing the project in the database, reload the snapshot with
+# POST /api/demo/reload.
+
+demo_project_id = uuid.UUID(os.environ["DEMO_PROJECT_ID"]) if os.getenv("DEMO_PROJECT_ID") else None
+
+# Seconds clients and proxies may cache the demo responses without asking
+DEMO_CACHE_MAX_AGE = int(os.getenv("DEMO_CACHE_MAX_AGE", 3600))
+
+class Snapshot:
+    def __init__(self):
+        # Rendered body and ETag, keyed by the calculate parameter
+        self.responses: dict[models.Calculate, tuple[bytes, str]] = {}
+
+    def reload(self) -> bool:
+        # Returns False if there is no demo project (yet)
+        responses = {}
+        if demo_project_id:
+            with Session(engine) as session:
+                try:
+                    for calculate in (False, True, "optimal"):
+                        body = readmodel.ProjectResponse(
+                            readmodel.project_public(demo_project_id, session, calculate)).body
+                        # By content, as the project may have been changed
+                        # in the database without a new version
+                        responses[calculate] = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+                except HTTPException:
+                    responses = {}
+        # Replaced as a whole, so requests see either snapshot
+        self.responses = responses
+        return bool(responses)
+
+    def response(self, request: Request, calculate: models.Calculate) -> Response | None:
+        cached = self.responses.get(calculate)
+        if cached is None:
+            return None
+
+        body, etag = cached
+        response = Response(body, media_type="application/json")
+        not_modified = helper.not_modified_or_none(
+            request, response, etag, cache_control=f"public, max-age={DEMO_CACHE_MAX_AGE}")
+        return not_modified or response
+
+snapshot = Snapshot()
@@ -0,0 +1,237 @@
+from collections.abc import AsyncIterator
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import Session
+from typing import Any
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from app import demo, readmodel
+from app.database import engine
+
+# Change notifications for the open clients of a project, sent as
+# Server-Sent Events. Every write queues an event, which a background task
+# publishes through the broadcast backend in order, so the request doesn't
+# wait for it. The backend hands it to the hub of every worker process,
+# which fans it out to the queues of the local subscribers of the project.
+#
+#   event: change
+#   data: {"type": "expense.updated", "project_id": "...", "data": {...}}
+#
+# Subscribers can ask for the settlement of the project as well, which is
+# calculated once per event and worker.
+
+logger = logging.getLogger(__name__)
+
+# Events a subscriber can fall behind, before it gets disconnected. The
+# client reconnects and reloads the project
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 16))
+
+# Seconds between comments on idle streams, so proxies keep them open
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", 15))
+
+# memory:// for a single worker process, redis://host:port to share the
+# events between the workers and hosts
+EVENTS_BROADCAST_URL = os.getenv("EVENTS_BROADCAST_URL", "memory://")
+
+# Events waiting to be published, further events are dropped
+OUTBOX_SIZE = 1024
+
+class Subscriber:
+    __slots__ = ("project_id", "settlement", "queue")
+
+    def __init__(self, project_id: uuid.UUID, settlement: bool):
+        self.project_id = project_id
+        self.settlement = settlement
+        # Serialized events, None ends the stream
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(EVENTS_QUEUE_SIZE)
+
+class Hub:
+    def __init__(self):
+        self.subscribers: dict[uuid.UUID, set[Subscriber]] = {}
+        self.dropped = 0
+
+    def subscribe(self, project_id: uuid.UUID, settlement: bool = False) -> Subscriber:
+        subscriber = Subscriber(project_id, settlement)
+        self.subscribers.setdefault(project_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self.subscribers.get(subscriber.project_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[subscriber.project_id]
+
+    def count(self) -> int:
+        return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    def end(self, subscriber: Subscriber):
+        # The end marker goes after the pending events. Only if the queue
+        # is full, they are obsolete and make room for it
+        self.unsubscribe(subscriber)
+        try:
+            subscriber.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(None)
+
+    def close(self, project_id: uuid.UUID | None = None):
+        # End the streams of a project, or all streams on shutdown
+        project_ids = [project_id] if project_id else list(self.subscribers)
+        for id in project_ids:
+            for subscriber in list(self.subscribers.get(id, ())):
+                self.end(subscriber)
+
+    async def dispatch(self, event: dict):
+        if event["type"] == "demo.reloaded":
+            # Published by POST /demo/reload, so every worker refreshes its
+            # snapshot of the demo project
+            await run_in_threadpool(demo.snapshot.reload)
+
+        project_id = uuid.UUID(event["project_id"])
+        subscribers = self.subscribers.get(project_id)
+        if not subscribers:
+            return
+
+        message = format_event(event)
+        settlement_message = None
+        if any(subscriber.settlement for subscriber in subscribers):
+            payments = await run_in_threadpool(load_payments, project_id)
+            settlement_message = format_event({**event, "payments": payments})
+
+        for subscriber in list(subscribers):
+            try:
+                subscriber.queue.put_nowait(
+                    settlement_message if subscriber.settlement and settlement_message else message)
+            except asyncio.QueueFull:
+                # Slow consumers don't hold back the others
+                self.dropped += 1
+                self.end(subscriber)
+
+        if event["type"] == "project.deleted":
+            self.close(project_id)
+
+    async def stream(self, project_id: uuid.UUID, settlement: bool = False) -> AsyncIterator[str]:
+        # Subscribe only once the response is sent, so the subscriber is
+        # always removed again
+        subscriber = self.subscribe(project_id, settlement)
+        try:
+            # Clients reconnect after a second, e.g. when they got dropped
+            yield "retry: 1000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), EVENTS_KEEPALIVE)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+def format_event(event: dict) -> str:
+    return f"event: change\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+def load_payments(project_id: uuid.UUID) -> list | None:
+    # Events are dispatched outside of requests, so use an own session
+    with Session(engine) as session:
+        try:
+            return jsonable_encoder(readmodel.project_payments(project_id, session))
+        except HTTPException:
+            return None
+
+### Broadcast backends
+
+class LocalBroadcast:
+    # Events stay in the worker process
+    def __init__(self, hub: Hub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        await self.hub.dispatch(event)
+
+class RedisBroadcast:
+    # Events go through a Redis channel, every worker dispatches all of
+    # them to its own subscribers
+    CHANNEL = "tabsplid:events"
+
+    def __init__(self, hub: Hub, url: str):
+        self.hub = hub
+        self.url = url
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        from redis import asyncio as redis
+        self.client = redis.from_url(self.url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.CHANNEL)
+        self.task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+    async def listen(self):
+        async for message in self.pubsub.listen():
+            try:
+                await self.hub.dispatch(json.loads(message["data"]))
+            except Exception:
+                logger.exception("Failed to dispatch event")
+
+    async def publish(self, event: dict):
+        await self.client.publish(self.CHANNEL, json.dumps(event, separators=(",", ":")))
+
+def get_broadcast(url: str, hub: Hub) -> LocalBroadcast | RedisBroadcast:
+    scheme = url.split("://")[0]
+    if scheme == "memory":
+        return LocalBroadcast(hub)
+    if scheme in ("redis", "rediss"):
+        return RedisBroadcast(hub, url)
+    raise ValueError(f"Unsupported EVENTS_BROADCAST_URL scheme '{scheme}'")
+
+hub = Hub()
+broadcast = get_broadcast(EVENTS_BROADCAST_URL, hub)
+outbox: asyncio.Queue[dict] = asyncio.Queue(OUTBOX_SIZE)
+deliveries: asyncio.Task | None = None
+
+async def deliver():
+    while True:
+        event = await outbox.get()
+        # The write is already committed, so a failed notification only
+        # gets logged
+        try:
+            await broadcast.publish(event)
+        except Exception:
+            logger.exception("Failed to publish event")
+
+async def start():
+    global deliveries
+    await broadcast.start()
+    deliveries = asyncio.create_task(deliver())
+
+async def stop():
+    if deliveries:
+        deliveries.cancel()
+    await broadcast.stop()
+
+async def publish(project_id: uuid.UUID, type: str, data: Any = None):
+    event = {"type": type, "project_id": str(project_id), "data": jsonable_encoder(data)}
+    try:
+        outbox.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.warning("Dropped event %s of project %s, the outbox is full", type, project_id)
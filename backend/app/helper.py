@@ -1,22 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlmodel import Session, asc, col, desc, nulls_last, select
-
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import bindparam
+from sqlmodel import Session, col, delete, func, insert, select, update
+from collections.abc import Iterable
 
 import bcrypt
+import hmac
 import uuid
 import os
+import secrets
 
-from app import models
+from app import models, ordering, settlement
+from app.cache import LRUCache
+from app.timing import timed
 
 # Configure Basic Auth
 security = HTTPBasic()
 
-# Initialize the limiter
-limiter = Limiter(key_func=get_remote_address)
-
 # Fetch the bcrypt hashed credentials from environment variable
 hashed_credentials = os.getenv("BASIC_AUTH")
 try:
@@ -24,9 +26,37 @@ try:
 except ValueError:
     raise RuntimeError("BASIC_AUTH environment variable must be in the format 'username:hashed_password'.")
 
+# Settlement results (balances and transfers), keyed by project id, version
+# and whether the optimal settlement was requested
+settlement_cache = LRUCache(maxsize=int(os.getenv("SETTLEMENT_CACHE_SIZE", 1024)))
+
+# CPU seconds and number of members up to which ?calculate=optimal searches
+# for the minimum number of transfers, see settlement.settle_optimal
+SETTLEMENT_OPTIMAL_BUDGET = float(os.getenv("SETTLEMENT_OPTIMAL_BUDGET", 0.2))
+SETTLEMENT_OPTIMAL_MAX_MEMBERS = int(os.getenv("SETTLEMENT_OPTIMAL_MAX_MEMBERS", 20))
+
+# Verified credentials, see verify_credentials
+credentials_cache = LRUCache(maxsize=128, ttl=float(os.getenv("AUTH_CACHE_TTL", 300)))
+credentials_secret = secrets.token_bytes(32)
+
 def get_router():
     return APIRouter(prefix="/api")
 
+def verify_credentials(username: str, password: str) -> bool:
+    # Successful verifications are cached for a while, to skip the costly
+    # bcrypt check on repeated requests. The key is an HMAC with a secret
+    # of this process, so the cache never holds the password itself.
+    # Failed attempts are never cached
+    key = hmac.digest(credentials_secret, f"{username}\0{password}".encode('UTF-8'), "sha256")
+    if credentials_cache.get(key):
+        return True
+
+    valid = hmac.compare_digest(username.encode('UTF-8'), auth_user.encode('UTF-8')) and bcrypt.checkpw(
+        password.encode('UTF-8'), auth_hash.encode('UTF-8'))
+    if valid:
+        credentials_cache.set(key, True)
+    return valid
+
 def authenticated_or_401(credentials: HTTPBasicCredentials = Depends(security)):
     # if auth_user or auth_hash are not defined, raise an exception
     if not (auth_user and auth_hash):
@@ -36,8 +66,7 @@ def authenticated_or_401(credentials: HTTPBasicCredentials = Depends(security)):
         )
 
     # Check if the provided credentials are correct
-    if not (credentials.username == auth_user and bcrypt.checkpw(
-        credentials.password.encode('UTF-8'), auth_hash.encode('UTF-8'))):
+    if not verify_credentials(credentials.username, credentials.password):
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
@@ -46,21 +75,82 @@ def authenticated_or_401(credentials: HTTPBasicCredentials = Depends(security)):
 
     return credentials.username
 
-def get_project_or_404(project_id: uuid.UUID, session: Session):
-    project = session.exec(
-            select(models.Project).where(
+# Eager load the complete project graph (members, their expenses and the
+# involved members of each expense) with one query per level, so the number
+# of queries doesn't grow with the size of the project. The relationships
+# are ordered by the database, see models.py
+project_graph_options = [
+    selectinload(models.Project.members)
+        .selectinload(models.Member.expenses),
+]
+
+def load_involved_members(expenses: Iterable[models.Expense], scope, session: Session):
+    # Set the involved members of loaded expenses with one query over the
+    # links of the scope (e.g. all expenses of a project). A selectinload
+    # would filter by the composite primary key of the expenses, which
+    # SQLite can't look up by index and scans all links instead
+    involved: dict[uuid.UUID, list[models.Member]] = {}
+    rows = session.exec(
+            select(models.ExpenseMemberLink.expense_id, models.Member).join(
+                models.Expense, models.Expense.id == models.ExpenseMemberLink.expense_id,
+                ).join(
+                models.Member, models.Member.id == models.ExpenseMemberLink.member_id,
+                ).where(scope)
+            ).all()
+    for expense_id, member in rows:
+        involved.setdefault(expense_id, []).append(member)
+
+    for expense in expenses:
+        set_committed_value(expense, "involved_members", involved.get(expense.id, []))
+
+def get_project_or_404(project_id: uuid.UUID, session: Session, load_graph: bool = True):
+    statement = select(models.Project).where(
+            models.Project.id == project_id,
+            )
+    if load_graph:
+        statement = statement.options(*project_graph_options)
+
+    project = session.exec(statement).first()
+
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if load_graph:
+        load_involved_members(
+            (expense for member in project.members for expense in member.expenses),
+            models.Expense.project_id == project_id, session)
+    return project
+
+def get_project_version_or_404(project_id: uuid.UUID, session: Session) -> int:
+    # Only fetch the revision of the project, without any members or expenses
+    version = session.exec(
+            select(models.Project.version).where(
                 models.Project.id == project_id,
                 )
             ).first()
 
-    if not project:
+    if version is None:
         raise HTTPException(status_code=404, detail="Project not found")
+    return version
 
-    # Sort members and expenses by order
-    project.members.sort(key=lambda x: (x.order is None, x.order))
-    for member in project.members:
-        member.expenses.sort(key=lambda x: (x.order is None, x.order))
-    return project
+def project_etag(project_id: uuid.UUID, version: int, variant: str = "") -> str:
+    # The variant distinguishes different representations of the same
+    # project revision, e.g. with and without calculated payments
+    return f'"{project_id.hex}-{version}{"-" + variant if variant else ""}"'
+
+def not_modified_or_none(request: Request, response: Response, etag: str,
+                         cache_control: str = "no-cache") -> Response | None:
+    # Set the ETag on the response and return a 304 response, if the
+    # client already has the current revision
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match uses the weak comparison, so ignore W/ prefixes
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+    return None
 
 def get_member_or_404(member_id: uuid.UUID, project_id: uuid.UUID, session: Session):
     member = session.exec(
@@ -74,11 +164,12 @@ def get_member_or_404(member_id: uuid.UUID, project_id: uuid.UUID, session: Sess
         raise HTTPException(status_code=404, detail="Member not found")
     return member
 
-def get_expense_or_404(expense_id: uuid.UUID, member_id: uuid.UUID, session: Session):
+def get_expense_or_404(expense_id: uuid.UUID, member_id: uuid.UUID, project_id: uuid.UUID, session: Session):
     expense = session.exec(
             select(models.Expense).where(
                 models.Expense.id == expense_id,
                 models.Expense.member_id == member_id,
+                models.Expense.project_id == project_id,
                 )
             ).first()
 
@@ -86,65 +177,212 @@ def get_expense_or_404(expense_id: uuid.UUID, member_id: uuid.UUID, session: Ses
         raise HTTPException(status_code=404, detail="Expense not found")
     return expense
 
-def remodel_involved_members(data, session):
-    involved_members = []
-    involved_member_ids = data.get("involved_members", [])
+def delete_project_or_404(project_id: uuid.UUID, session: Session):
+    # A single DELETE, the database removes the members, expenses and
+    # links through ON DELETE CASCADE
+    result = session.exec(delete(models.Project).where(models.Project.id == project_id))
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Project not found")
 
-    if involved_member_ids:
-        involved_members = session.exec(
-            select(models.Member).where(
-                col(models.Member.id).in_(involved_member_ids)
+def delete_member_or_404(member_id: uuid.UUID, project_id: uuid.UUID, session: Session):
+    # Removes the expenses of the member and all links to it as well
+    result = session.exec(
+            delete(models.Member).where(
+                models.Member.id == member_id,
+                models.Member.project_id == project_id,
+                )
+            )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Member not found")
+
+def bump_project_version(project_id: uuid.UUID, session: Session):
+    # Increment in the database, so concurrent writes can't lose a bump.
+    # This also refreshes Project.updated_at through its onupdate
+    session.exec(
+            update(models.Project).where(
+                models.Project.id == project_id,
+                ).values(version=models.Project.version + 1)
+            )
+
+def rebalance_order_keys(model: type[models.Member] | type[models.Expense], scope, session: Session):
+    # Spread the keys of a list evenly again, with one executemany UPDATE
+    ids = session.exec(
+            select(model.id).where(scope).order_by(model.order_key, model.id)
+            ).all()
+
+    table = model.__table__
+    session.connection().execute(
+        update(table).where(
+            table.c.id == bindparam("b_id"),
+            ).values(order_key=bindparam("b_order_key"), order=bindparam("b_order")),
+        [
+            {"b_id": entry_id, "b_order_key": ordering.index_key(index), "b_order": index}
+            for index, entry_id in enumerate(ids)
+        ],
+    )
+    session.expire_all()
+
+def move_entry_or_404(entry: models.Member | models.Expense, scope, data: models.MoveRequest, session: Session):
+    # Place an entry between two neighbours of its list (given by scope) by
+    # only changing its own order key. One of the neighbours is enough,
+    # the other one is looked up
+    model = type(entry)
+    neighbour_ids = [neighbour for neighbour in (data.after, data.before) if neighbour]
+    if not neighbour_ids:
+        raise HTTPException(status_code=422, detail="Either after or before must be set")
+    if entry.id in neighbour_ids:
+        raise HTTPException(status_code=422, detail="An entry can't be its own neighbour")
+
+    def neighbour_keys():
+        keys = dict(session.exec(
+                select(model.id, model.order_key).where(
+                    scope, col(model.id).in_(neighbour_ids),
+                    )
+                ).all())
+        if len(keys) != len(neighbour_ids):
+            raise HTTPException(status_code=404, detail="Neighbour not found")
+
+        lower = keys.get(data.after)
+        upper = keys.get(data.before)
+        others = [scope, model.id != entry.id]
+        if data.before is None:
+            upper = session.exec(
+                    select(func.min(model.order_key)).where(*others, model.order_key > lower)
+                    ).first()
+        elif data.after is None:
+            lower = session.exec(
+                    select(func.max(model.order_key)).where(*others, model.order_key < upper)
+                    ).first()
+        return lower, upper
+
+    lower, upper = neighbour_keys()
+    try:
+        key = ordering.key_between(lower, upper)
+    except ValueError:
+        # Neighbours in the wrong order or with the same key
+        key = None
+
+    if key is None or len(key) > ordering.MAX_KEY_LENGTH:
+        # Make room and try again
+        rebalance_order_keys(model, scope, session)
+        lower, upper = neighbour_keys()
+        try:
+            key = ordering.key_between(lower, upper)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="after must be placed before before")
+
+    entry.order_key = key
+    session.add(entry)
+
+def involved_member_ids_or_404(member_ids: list[uuid.UUID], project_id: uuid.UUID, session: Session) -> list[uuid.UUID]:
+    # Only members of the same project can be involved, checked with a
+    # single query for the ids
+    member_ids = list(dict.fromkeys(member_ids))
+    if not member_ids:
+        return member_ids
+
+    found = session.exec(
+        select(func.count()).select_from(models.Member).where(
+            models.Member.project_id == project_id,
+            col(models.Member.id).in_(member_ids),
+        )
+    ).one()
+
+    if found != len(member_ids):
+        raise HTTPException(
+            status_code=404,
+            detail="One or more involved members not found"
+        )
+    return member_ids
+
+def set_involved_members(expense: models.Expense, member_ids: list[uuid.UUID], session: Session,
+                         current: list[uuid.UUID] | None = None):
+    # Write only the difference to the existing links of the expense, with
+    # at most one INSERT and one DELETE. The current ids can be passed if
+    # they are already loaded
+    if current is None:
+        current = session.exec(
+            select(models.ExpenseMemberLink.member_id).where(
+                models.ExpenseMemberLink.expense_id == expense.id,
             )
         ).all()
+    added = [member_id for member_id in member_ids if member_id not in current]
+    removed = [member_id for member_id in current if member_id not in member_ids]
 
-        if len(involved_members) != len(involved_member_ids):
-            raise HTTPException(
-                status_code=404,
-                detail="One or more involved members not found"
+    # The expense row has to exist for the links
+    session.flush()
+    if added:
+        session.exec(insert(models.ExpenseMemberLink), params=[
+            {"expense_id": expense.id, "member_id": member_id} for member_id in added
+        ])
+    if removed:
+        session.exec(
+            delete(models.ExpenseMemberLink).where(
+                models.ExpenseMemberLink.expense_id == expense.id,
+                col(models.ExpenseMemberLink.member_id).in_(removed),
             )
+        )
+    if added or removed:
+        session.expire(expense, ["involved_members"])
+
+def settlement_entries(project: models.Project) -> list[settlement.Entry]:
+    # Read the project into plain (member_id, paid, owed) tuples, without
+    # touching the ORM state. Walk the expenses through their paying
+    # member, which is already loaded with the project graph
+    member_ids = [member.id for member in project.members]
+    paid = dict.fromkeys(member_ids, 0)
+    owed = dict.fromkeys(member_ids, 0)
+
+    for payer in project.members:
+        for expense in payer.expenses:
+            amount = settlement.to_cents(expense.amount)
+            involved_ids = [member.id for member in expense.involved_members] or member_ids
+
+            # Shares of members of other projects, linked before links were
+            # checked, are left out as in the migration of the balances
+            for member_id, share in settlement.split(amount, involved_ids, expense.id.int):
+                if member_id in owed:
+                    owed[member_id] += share
+            paid[payer.id] += amount
+
+    return [(member_id, paid[member_id], owed[member_id]) for member_id in member_ids]
+
+def project_transfers(project_id: uuid.UUID, version: int,
+                      member_balances: Iterable[tuple[uuid.UUID, int]],
+                      optimal: bool = False) -> list[settlement.Transfer]:
+    # Unchanged projects have the same version, so the calculation is only
+    # done once per revision and mode
+    key = (project_id, version, optimal)
+    cached = settlement_cache.get(key)
+    if cached is None:
+        # The balances are maintained on every expense write (see
+        # balances.py), so only the stored values have to be read
+        with timed("settlement"):
+            balances = settlement.compute_balances(
+                (member_id, balance, 0) for member_id, balance in member_balances)
+            if optimal:
+                transfers = settlement.settle_optimal(
+                    balances, SETTLEMENT_OPTIMAL_BUDGET, SETTLEMENT_OPTIMAL_MAX_MEMBERS)
+            else:
+                transfers = settlement.settle_balances(balances)
+            cached = (balances, transfers)
+        settlement_cache.set(key, cached)
+    _, transfers = cached
+    return transfers
 
-    data["involved_members"] = involved_members
-    return data
-
-def calculate_project_payments(project: models.Project) -> list[models.PaymentPublic]:
-    # Reset all member balances
-    for member in project.members:
-        member.balance = 0
-
-    # Distribute expense amounts to members
-    for expense in project.expenses:
-        involved_members = expense.involved_members or project.members
-        part_amount = (expense.amount or 0) / len(involved_members)
-
-        for member in involved_members:
-            member.balance -= part_amount
-        expense.member.balance += (expense.amount or 0)
-
-    # Calculate payments to settle balances
-    payments = []
-    for member in project.members:
-        if member.balance < 0:
-            for other_member in project.members:
-                if other_member.balance > 0:
-                    amount = min(abs(member.balance), other_member.balance)
-                    payments.append(models.Payment(
-                        from_member=member,
-                        to_member=other_member,
-                        amount=amount
-                    ))
-
-                    # Update balances after payment
-                    member.balance += amount
-                    other_member.balance -= amount
+def calculate_project_payments(project: models.Project, optimal: bool = False) -> list[models.PaymentPublic]:
+    transfers = project_transfers(
+        project.id, project.version, ((member.id, member.balance_cents) for member in project.members), optimal)
 
     # Convert payments to public format
+    members = {member.id: models.MemberPublic.model_validate(member) for member in project.members}
     payments_public = [
         models.PaymentPublic(
-            from_member=models.MemberPublic.model_validate(payment.from_member),
-            to_member=models.MemberPublic.model_validate(payment.to_member),
-            amount=payment.amount
+            from_member=members[from_id],
+            to_member=members[to_id],
+            amount=settlement.from_cents(amount)
         )
-        for payment in payments
+        for from_id, to_id, amount in transfers
     ]
 
     return payments_public
@@ -1,19 +1,65 @@
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
 from slowapi import Limiter
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
+import asyncio
+import functools
+import os
+
+# Register the sqlite:// rate limit storage
+from app import ratelimit # noqa: F401
+from app import metrics
+
+# Storage of the rate limit counters. memory:// keeps separate counters in
+# every worker process, so use a shared storage with multiple workers:
+#   sqlite:///ratelimit.db   all workers on a single host
+#   redis://localhost:6379   all workers on all hosts
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
+
+# The sliding window counter needs two counters per limit and client,
+# so every request costs O(1) storage operations
+RATELIMIT_STRATEGY = os.getenv("RATELIMIT_STRATEGY", "sliding-window-counter")
+
 # custom_error_handler
 def custom_handler(request: Request, exc: RateLimitExceeded):
+    metrics.registry.record_rate_limited()
     return JSONResponse(
         status_code=429,
         content={"message": "You have exceeded your rate limit"},
     )
 
+class ThreadedLimiter(Limiter):
+    # slowapi checks the limits of async endpoints on the event loop, and
+    # the storage calls block (sqlite:// waits up to its busy timeout for
+    # the lock of other workers). The check runs in the threadpool first,
+    # so the wrapper of slowapi only adds the headers
+    def limit(self, *args, **kwargs):
+        decorator = super().limit(*args, **kwargs)
+
+        def wrap(func):
+            wrapped = decorator(func)
+            if not asyncio.iscoroutinefunction(func):
+                return wrapped
+
+            @functools.wraps(func)
+            async def checked(*args, **kwargs):
+                request = kwargs.get("request")
+                if (self.enabled and self._auto_check and isinstance(request, Request)
+                        and not getattr(request.state, "_rate_limiting_complete", False)):
+                    await run_in_threadpool(self._check_request_limit, request, func, False)
+                    request.state._rate_limiting_complete = True
+                return await wrapped(*args, **kwargs)
+            return checked
+        return wrap
+
 # Initialize the limiter
-limiter = Limiter(
+limiter = ThreadedLimiter(
     key_func=get_remote_address,
     enabled=True,
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
 )
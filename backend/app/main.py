@@ -1,20 +1,31 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 
 from slowapi.errors import RateLimitExceeded
 
 from app.database import init_db
-from app.routers import projects, members, expenses
-from app import middlewares
+from app.routers import projects, members, expenses, metrics as metrics_router
+from app import demo, events, metrics, middlewares, retention
 from app.limiter import limiter, custom_handler
 
 
-# Initialize the database
+# Initialize the database, the demo snapshot, the event broadcast and the
+# retention purge
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     init_db()
+    demo.snapshot.reload()
+    await events.start()
+    purge = None
+    if retention.RETENTION_DAYS > 0 and retention.RETENTION_INTERVAL > 0:
+        purge = asyncio.create_task(retention.purge_periodically())
     yield
+    if purge:
+        purge.cancel()
+    events.hub.close()
+    await events.stop()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -31,12 +42,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],
 )
 
 # Include the routers
 app.include_router(projects.router)
 app.include_router(members.router)
 app.include_router(expenses.router)
+app.include_router(metrics_router.router)
 
 # Include the middlewares
 app.middleware("http")(middlewares.reject_demo_requests)
+# Outermost, so it also times the rejected requests
+app.middleware("http")(metrics.instrument_requests)
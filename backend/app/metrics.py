@@ -0,0 +1,133 @@
+from fastapi import Request
+from starlette.routing import Match
+import threading
+import time
+
+from app.database import pool_stats
+from app.timing import RequestTimings, request_timings
+
+# Request metrics of this worker process, rendered in the Prometheus text
+# format by GET /api/metrics. Every worker has its own registry, so scrape
+# all of them (or run a single worker per target).
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Keyed by (method, route)
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.queries: dict[tuple[str, str], int] = {}
+        self.db_seconds: dict[tuple[str, str], float] = {}
+        # Keyed by (method, route, status)
+        self.responses: dict[tuple[str, str, int], int] = {}
+        self.rate_limited = 0
+
+    def observe(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings):
+        key = (method, route)
+        with self._lock:
+            self.latency.setdefault(key, Histogram()).observe(seconds)
+            self.queries[key] = self.queries.get(key, 0) + timings.queries
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + timings.spans.get("db", 0.0)
+            status_key = (method, route, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+
+    def record_rate_limited(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    def render(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help: str):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            metric("http_request_duration_seconds", "histogram", "Time until the response headers were sent")
+            for (method, route), histogram in sorted(self.latency.items()):
+                labels = f'method="{method}",route="{route}"'
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+            metric("http_responses_total", "counter", "Responses by status code")
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+            metric("db_queries_total", "counter", "Database queries executed by requests")
+            for (method, route), count in sorted(self.queries.items()):
+                lines.append(f'db_queries_total{{method="{method}",route="{route}"}} {count}')
+
+            metric("db_query_seconds_total", "counter", "Time spent in database queries by requests")
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'db_query_seconds_total{{method="{method}",route="{route}"}} {seconds}')
+
+            metric("ratelimit_rejections_total", "counter", "Requests rejected by the rate limiter")
+            lines.append(f"ratelimit_rejections_total {self.rate_limited}")
+
+        stats = pool_stats()
+        metric("db_pool_checkouts_total", "counter", "Connections checked out of the pool")
+        lines.append(f"db_pool_checkouts_total {stats['checkouts']}")
+        metric("db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection")
+        lines.append(f"db_pool_wait_seconds_total {stats['wait_seconds']}")
+        metric("db_pool_max_wait_seconds", "gauge", "Longest wait for a pooled connection")
+        lines.append(f"db_pool_max_wait_seconds {stats['max_wait_seconds']}")
+        for name in ("size", "checked_in", "checked_out", "overflow"):
+            if name in stats:
+                metric(f"db_pool_{name}", "gauge", f"Connection pool {name.replace('_', ' ')}")
+                lines.append(f"db_pool_{name} {stats[name]}")
+
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def route_template(request: Request) -> str:
+    # Label by the path template, so project ids don't create new series
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    for route in request.app.router.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            return route.path
+    return "unmatched"
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    metrics = []
+    for name, seconds in timings.spans.items():
+        description = f';desc="{timings.queries} queries"' if name == "db" else ""
+        metrics.append(f"{name};dur={seconds * 1000:.1f}{description}")
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+# Middleware to time requests and expose the timings in a Server-Timing
+# header. Streamed responses are timed until their headers are sent
+async def instrument_requests(request: Request, call_next):
+    timings = RequestTimings()
+    token = request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    elapsed = time.perf_counter() - start
+
+    registry.observe(request.method, route_template(request), response.status_code, elapsed, timings)
+    response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
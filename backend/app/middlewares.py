@@ -1,13 +1,19 @@
 from fastapi import Request, Response
-import os
+import uuid
 
-demo_project_id = os.getenv("DEMO_PROJECT_ID")
+from app.demo import demo_project_id
 
 # Middleware to reject requests to the demo endpoint
 async def reject_demo_requests(request: Request, call_next):
-    # UUIDs can be with or without dashes, so we first normalize the URL
-    normalized = request.url.path.replace("-", "")
-    if demo_project_id and demo_project_id in normalized:
-        if request.method not in ["GET", "OPTIONS"]:
-            return Response(status_code=403)
+    # The project id is the fourth segment of /api/projects/{id}/... and is
+    # parsed like the path parameter, which accepts every spelling of a UUID
+    if demo_project_id and request.method not in ("GET", "OPTIONS"):
+        segments = request.url.path.split("/", 4)
+        if len(segments) > 3:
+            try:
+                project_id = uuid.UUID(segments[3])
+            except ValueError:
+                project_id = None
+            if project_id == demo_project_id:
+                return Response(status_code=403)
     return await call_next(request)
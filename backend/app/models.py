@@ -1,12 +1,22 @@
-from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import BigInteger, Column, DateTime, Index, Table, event
+from sqlalchemy.orm import Session as OrmSession
+from pydantic import Field as ValidatedField
+from sqlmodel import SQLModel, Field, Relationship, func, select
 from datetime import datetime, timezone
+from typing import Annotated, Any, Literal
 import uuid, uuid6
 
+from app import ordering
+
+# Orders given by clients have to fit into an order key, see ordering.py.
+# Stored orders aren't checked, older entries can have any integer
+OrderIndex = Annotated[int, ValidatedField(ge=0, lt=ordering.MAX_INDEX)]
+
 ### Links
 
 class ExpenseMemberLink(SQLModel, table=True):
-    expense_id: uuid.UUID | None = Field(default=None, foreign_key="expense.id", primary_key=True)
-    member_id: uuid.UUID | None = Field(default=None, foreign_key="member.id", primary_key=True)
+    expense_id: uuid.UUID | None = Field(default=None, foreign_key="expense.id", ondelete="CASCADE", primary_key=True)
+    member_id: uuid.UUID | None = Field(default=None, foreign_key="member.id", ondelete="CASCADE", primary_key=True, index=True)
 
 ###
 
@@ -15,11 +25,18 @@ class ProjectBase(SQLModel):
 
 class Project(ProjectBase, table=True):
     id: uuid.UUID = Field(primary_key=True, default_factory=uuid6.uuid7)
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc),
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True,
         sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)})
-    members: list["Member"] = Relationship(back_populates="project", cascade_delete=True)
-    expenses: list["Expense"] = Relationship(back_populates="project", cascade_delete=True)
+    # Revision of the project, bumped on every write to the project, its
+    # members or expenses. Used to key cached calculations
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    # Children are deleted by the database (ON DELETE CASCADE), without
+    # loading them first
+    members: list["Member"] = Relationship(back_populates="project", cascade_delete=True, passive_deletes=True,
+        sa_relationship_kwargs={"order_by": "(Member.order_key, Member.id)"})
+    expenses: list["Expense"] = Relationship(back_populates="project", cascade_delete=True, passive_deletes=True,
+        sa_relationship_kwargs={"order_by": "(Expense.order_key, Expense.id)"})
 
 class ProjectPublicAll(ProjectBase):
     id: uuid.UUID
@@ -47,13 +64,23 @@ class MemberBase(SQLModel):
     order: int | None = None
 
 class Member(MemberBase, table=True):
+    __table_args__ = (
+        Index("ix_member_project_id_order_key", "project_id", "order_key"),
+        # Referenced by the foreign keys on member.id alone
+        Index("ux_member_id", "id", unique=True),
+    )
+
     id: uuid.UUID = Field(primary_key=True, default_factory=uuid6.uuid7)
-    project_id: uuid.UUID | None = Field(primary_key=True, default=None, foreign_key="project.id")
-    balance: float = Field(default=0)
+    project_id: uuid.UUID | None = Field(primary_key=True, default=None, foreign_key="project.id", ondelete="CASCADE")
+    # Balance in cents, maintained on every expense write (see balances.py)
+    balance_cents: int = Field(default=0, sa_type=BigInteger, sa_column_kwargs={"server_default": "0"})
+    # Position in the member list, see ordering.py
+    order_key: str | None = Field(default=None, max_length=64)
     project: "Project" = Relationship(back_populates="members")
-    expenses: list["Expense"] = Relationship(back_populates="member", cascade_delete=True)
+    expenses: list["Expense"] = Relationship(back_populates="member", cascade_delete=True, passive_deletes=True,
+        sa_relationship_kwargs={"order_by": "(Expense.order_key, Expense.id)"})
     involved_expenses: list["Expense"] = Relationship(
-            back_populates="involved_members", link_model=ExpenseMemberLink)
+            back_populates="involved_members", link_model=ExpenseMemberLink, passive_deletes=True)
 
 class MemberPublic(MemberBase):
     id: uuid.UUID
@@ -63,10 +90,10 @@ class MemberPublicWithExpenses(MemberBase):
     expenses: list["ExpensePublic"] = []
 
 class MemberCreate(MemberBase):
-    pass
+    order: OrderIndex | None = None
 
 class MemberUpdate(MemberBase):
-    pass
+    order: OrderIndex | None = None
 
 
 
@@ -78,32 +105,154 @@ class ExpenseBase(SQLModel):
     order: int | None = None
 
 class Expense(ExpenseBase, table=True):
+    __table_args__ = (
+        Index("ix_expense_project_id_order_key", "project_id", "order_key"),
+        # Also serves lookups by member_id alone
+        Index("ix_expense_member_id_order_key", "member_id", "order_key"),
+        # Referenced by the foreign key on expense.id alone
+        Index("ux_expense_id", "id", unique=True),
+    )
+
     id: uuid.UUID = Field(primary_key=True, default_factory=uuid6.uuid7)
-    project_id: uuid.UUID = Field(primary_key=True, foreign_key="project.id")
-    member_id: uuid.UUID = Field(primary_key=True, foreign_key="member.id")
+    project_id: uuid.UUID = Field(primary_key=True, foreign_key="project.id", ondelete="CASCADE")
+    member_id: uuid.UUID = Field(primary_key=True, foreign_key="member.id", ondelete="CASCADE")
+    # Position in the expense list of the member, see ordering.py
+    order_key: str | None = Field(default=None, max_length=64)
     project: "Project" = Relationship(back_populates="expenses")
     member: "Member" = Relationship(back_populates="expenses")
     involved_members: list["Member"] = Relationship(
-            back_populates="involved_expenses", link_model=ExpenseMemberLink)
+            back_populates="involved_expenses", link_model=ExpenseMemberLink, passive_deletes=True)
 
 class ExpensePublic(ExpenseBase):
     id: uuid.UUID
     involved_members: list["MemberPublic"] = []
 
 class ExpenseCreate(ExpenseBase):
+    order: OrderIndex | None = None
     involved_members: list[uuid.UUID] = []
 
 class ExpenseUpdate(ExpenseBase):
+    order: OrderIndex | None = None
     involved_members: list[uuid.UUID] | None = None
 
+class ExpenseImport(ExpenseBase):
+    # Members are referenced by id or name
+    payer: str
+    order: OrderIndex | None = None
+    involved_members: list[str] = []
+
+class ExpenseImportResult(SQLModel):
+    imported: int
+
 ###
 
-class Payment(SQLModel):
-    from_member: "Member"
-    to_member: "Member"
-    amount: float
+class MoveRequest(SQLModel):
+    # Neighbours after the move, None for the start or the end of the list
+    after: uuid.UUID | None = None
+    before: uuid.UUID | None = None
+
+###
+
+# Payments to calculate: true settles with the fast greedy matching,
+# "optimal" searches for the minimum number of transfers
+Calculate = bool | Literal["optimal"]
 
 class PaymentPublic(SQLModel):
     from_member: "MemberPublic"
     to_member: "MemberPublic"
     amount: float
+
+class MemberSummary(MemberPublic):
+    paid: float
+    owed: float
+    balance: float
+
+class ProjectSummary(SQLModel):
+    id: uuid.UUID
+    members: list[MemberSummary] = []
+    payments: list[PaymentPublic] = []
+
+###
+
+class BatchOperation(SQLModel):
+    op: Literal["create", "update", "delete"]
+    type: Literal["member", "expense"]
+    # Id of the member or expense. On create, an optional temporary id,
+    # which later operations can use to reference the new entry
+    id: str | None = None
+    # Paying member of the expense, also resolves temporary ids
+    member_id: str | None = None
+    # Fields of MemberCreate/MemberUpdate or ExpenseCreate/ExpenseUpdate
+    data: dict[str, Any] = {}
+
+class BatchRequest(SQLModel):
+    operations: list[BatchOperation]
+    calculate: Calculate = False
+
+class BatchResult(SQLModel):
+    project: ProjectPublic
+    # Temporary ids mapped to the ids of the created entries
+    ids: dict[str, uuid.UUID] = {}
+
+
+### Archive
+
+# Copies of the tables for projects moved out by the retention purge (see
+# retention.py), with the time of archival. Only keyed by the primary key,
+# as they are never queried by the API
+def archive_table(model: type[SQLModel]) -> Table:
+    table = model.__table__
+    return Table(
+        f"{table.name}_archive", SQLModel.metadata,
+        *(Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+          for column in table.columns),
+        Column("archived_at", DateTime, nullable=False),
+    )
+
+project_archive = archive_table(Project)
+member_archive = archive_table(Member)
+expense_archive = archive_table(Expense)
+expensememberlink_archive = archive_table(ExpenseMemberLink)
+
+### Order keys
+
+# Setting the integer order also places the entry at that index
+@event.listens_for(Member.order, "set")
+@event.listens_for(Expense.order, "set")
+def set_order_key(target, value, oldvalue, initiator):
+    if value is not None:
+        target.order_key = ordering.index_key(value)
+
+# Entries created without an order are appended to their list. The keys are
+# assigned once per flush, with one lookup of the last key per list, so
+# entries created together get consecutive keys
+@event.listens_for(OrmSession, "before_flush")
+def append_new_entries(session, flush_context, instances):
+    lists: dict[tuple, list[Member | Expense]] = {}
+    new_ids = set()
+    for target in session.new:
+        if isinstance(target, (Project, Member)):
+            new_ids.add(target.id)
+        if isinstance(target, Member):
+            scope = (Member, Member.project_id, target.project_id or (target.project and target.project.id))
+        elif isinstance(target, Expense):
+            scope = (Expense, Expense.member_id, target.member_id or (target.member and target.member.id))
+        else:
+            continue
+        # The constructor doesn't fire the set event of the order
+        if target.order_key is None and target.order is not None:
+            target.order_key = ordering.index_key(target.order)
+        lists.setdefault(scope, []).append(target)
+
+    for (model, column, scope_id), targets in lists.items():
+        if all(target.order_key is not None for target in targets):
+            continue
+        # The lists of new projects and members are still empty
+        keys = [target.order_key for target in targets if target.order_key is not None]
+        if scope_id not in new_ids:
+            with session.no_autoflush:
+                keys.append(session.execute(select(func.max(model.order_key)).where(column == scope_id)).scalar())
+        last = max((key for key in keys if key), default=None)
+        for target in targets:
+            if target.order_key is None:
+                last = target.order_key = ordering.key_between(last, None)
@@ -0,0 +1,68 @@
+# Sortable order keys for members and expenses. A key is a string of base 36
+# digits, read as a fraction (0.d1d2d3...), so there is always room for a
+# key between two others and moving an entry writes only its own row.
+#
+# Only digits and lowercase letters are used, so the keys sort the same with
+# case-insensitive database collations. Keys never end with "0", otherwise
+# there would be no key between "a" and "a0".
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# Keys derived from the integer order of an entry: fixed width, followed by
+# the middle digit, so there is room around each of them
+INDEX_WIDTH = 6
+# Integer orders that fit into the fixed width
+MAX_INDEX = len(DIGITS) ** INDEX_WIDTH
+
+# Keys longer than this trigger a rebalance of all keys of the list
+MAX_KEY_LENGTH = 48
+
+def index_key(index: int) -> str:
+    digits = ""
+    for _ in range(INDEX_WIDTH):
+        index, digit = divmod(index, len(DIGITS))
+        digits = DIGITS[digit] + digits
+    if index:
+        raise ValueError("Index too large for an order key")
+    return digits + DIGITS[len(DIGITS) // 2]
+
+def midpoint(lower: str, upper: str | None) -> str:
+    # Key between lower ("" for the start) and upper (None for the end)
+    if upper is not None:
+        # Keep the common prefix
+        prefix = 0
+        while (lower[prefix] if prefix < len(lower) else "0") == upper[prefix]:
+            prefix += 1
+        if prefix > 0:
+            return upper[:prefix] + midpoint(lower[prefix:], upper[prefix:])
+
+    digit_lower = DIGITS.index(lower[0]) if lower else 0
+    digit_upper = DIGITS.index(upper[0]) if upper is not None else len(DIGITS)
+    if digit_upper - digit_lower > 1:
+        return DIGITS[(digit_lower + digit_upper + 1) // 2]
+
+    # The first digits are adjacent, continue after the lower one
+    if upper is not None and len(upper) > 1:
+        return upper[0]
+    return DIGITS[digit_lower] + midpoint(lower[1:], None)
+
+def leading_index(key: str) -> int:
+    # The first INDEX_WIDTH digits of a key as a number
+    return int(key[:INDEX_WIDTH].ljust(INDEX_WIDTH, "0"), len(DIGITS))
+
+def key_between(lower: str | None, upper: str | None) -> str:
+    if lower is not None and upper is not None and lower >= upper:
+        raise ValueError("The lower key must sort before the upper key")
+
+    # Appending and prepending step to the neighbouring index key instead of
+    # halving the remaining room, so the keys stay short however many
+    # entries are added at either end of a list
+    if upper is None and lower is not None:
+        index = leading_index(lower) + 1
+        if index < len(DIGITS) ** INDEX_WIDTH:
+            return index_key(index)
+    if lower is None and upper is not None:
+        index = leading_index(upper) - 1
+        if index >= 0:
+            return index_key(index)
+    return midpoint(lower or "", upper)
@@ -0,0 +1,156 @@
+from limits.storage import Storage, SlidingWindowCounterSupport
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Rate limit storage in a SQLite file, shared by all worker processes on a
+# single host. Registered for the sqlite:// scheme of RATELIMIT_STORAGE_URI:
+#
+#   sqlite:///relative/path.db
+#   sqlite:////absolute/path.db
+#
+# Every counter is a single row, so each request costs one statement.
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport):
+    STORAGE_SCHEME = ["sqlite"]
+
+    # Remove expired counters every n increments
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.removeprefix("sqlite:///")
+        self.timeout = float(options.get("timeout", 5))
+        self._lock = threading.Lock()
+        self._increments = 0
+        self._pid: int | None = None
+        self._sqlite: sqlite3.Connection | None = None
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # Connect lazily and once per process, as SQLite connections must
+        # not be shared with forked workers
+        if self._pid != os.getpid():
+            # Autocommit mode, transactions are started explicitly
+            self._sqlite = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            self._sqlite.execute("PRAGMA journal_mode=WAL")
+            self._sqlite.execute("PRAGMA synchronous=NORMAL")
+            self._sqlite.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit ("
+                "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL)")
+            self._pid = os.getpid()
+        return self._sqlite
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _incr(self, key: str, expiry: float, amount: int) -> int:
+        # Start a new window if the stored one has expired. The SET
+        # expressions all see the values of the existing row
+        now = time.time()
+        row = self._connection.execute(
+            "INSERT INTO ratelimit (key, count, expires) VALUES (:key, :amount, :now + :expiry) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "count = CASE WHEN expires <= :now THEN :amount ELSE count + :amount END, "
+            "expires = CASE WHEN expires <= :now THEN :now + :expiry ELSE expires END "
+            "RETURNING count",
+            {"key": key, "amount": amount, "now": now, "expiry": expiry},
+        ).fetchone()
+
+        self._increments += 1
+        if self._increments % self.PURGE_INTERVAL == 0:
+            self._connection.execute("DELETE FROM ratelimit WHERE expires <= ?", (now,))
+        return row[0]
+
+    def _get(self, key: str) -> int:
+        row = self._connection.execute(
+            "SELECT count FROM ratelimit WHERE key = ? AND expires > ?", (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        with self._lock:
+            return self._incr(key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            return self._get(key)
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT expires FROM ratelimit WHERE key = ?", (key,),
+            ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            with self._lock:
+                self._connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        with self._lock:
+            return self._connection.execute("DELETE FROM ratelimit").rowcount
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM ratelimit WHERE key = ?", (key,))
+
+    # Sliding window counter: one counter per fixed window, the previous
+    # window is weighted by how much of it still overlaps the sliding window
+
+    def _window_keys(self, key: str, expiry: float, now: float) -> tuple[str, str, float]:
+        window = math.floor(now / expiry)
+        elapsed = now - window * expiry
+        return f"{key}/{window - 1}", f"{key}/{window}", elapsed
+
+    def _sliding_window(self, key: str, expiry: float, now: float) -> tuple[int, float, int, float]:
+        previous_key, current_key, elapsed = self._window_keys(key, expiry, now)
+        return (
+            self._get(previous_key), expiry - elapsed,
+            self._get(current_key), 2 * expiry - elapsed,
+        )
+
+    def get_sliding_window(self, key: str, expiry: float) -> tuple[int, float, int, float]:
+        with self._lock:
+            return self._sliding_window(key, expiry, time.time())
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: float, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+
+        with self._lock:
+            # Check and increment in one write transaction, so concurrent
+            # workers can't both take the last slot
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                acquired = self._acquire_sliding_window_entry(key, limit, expiry, amount)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return acquired
+
+    def _acquire_sliding_window_entry(self, key: str, limit: int, expiry: float, amount: int) -> bool:
+        now = time.time()
+        previous, previous_ttl, current, _ = self._sliding_window(key, expiry, now)
+        weighted = previous * previous_ttl / expiry + current
+        if math.floor(weighted) + amount > limit:
+            return False
+
+        _, current_key, _ = self._window_keys(key, expiry, now)
+        self._incr(current_key, 2 * expiry, amount)
+        return True
+
+    def clear_sliding_window(self, key: str, expiry: float) -> None:
+        previous_key, current_key, _ = self._window_keys(key, expiry, time.time())
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM ratelimit WHERE key IN (?, ?)", (previous_key, current_key))
@@ -0,0 +1,173 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from itertools import groupby
+from sqlalchemy import BigInteger, cast
+from sqlmodel import Session, func, select
+from typing import Any
+import orjson
+import uuid
+
+from app import models, helper, settlement
+from app.timing import timed
+
+# Read path of the project detail without ORM objects and pydantic models.
+# The project, its members, expenses and expense links are fetched as plain
+# rows with one query each and assembled into dicts in the shape of
+# models.ProjectPublic, which ProjectResponse renders with orjson.
+#
+# The field order follows the public models, so both paths produce the
+# same JSON document.
+
+class ProjectResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        # orjson handles UUIDs and datetimes natively, aware datetimes in
+        # UTC are written with Z as pydantic does
+        with timed("serialize"):
+            return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+def member_public(member_id: uuid.UUID, name: str | None, order: int | None) -> dict:
+    return {"name": name, "order": order, "id": member_id}
+
+def member_rows(project_id: uuid.UUID, session: Session) -> list[tuple[uuid.UUID, str | None, int | None, int]]:
+    # (id, name, order, balance in cents) in the order of the member list
+    return list(session.exec(
+            select(
+                models.Member.id,
+                models.Member.name,
+                models.Member.order,
+                models.Member.balance_cents,
+                ).where(
+                    models.Member.project_id == project_id,
+                    ).order_by(models.Member.order_key, models.Member.id)
+            ).all())
+
+def payments_public(project_id: uuid.UUID, version: int, members: list[tuple], optimal: bool = False) -> list[dict]:
+    # Settlement of the member rows, with the cached transfers of the version
+    members_public = {member_id: member_public(member_id, name, order) for member_id, name, order, _ in members}
+    transfers = helper.project_transfers(
+        project_id, version, ((member_id, balance) for member_id, _, _, balance in members), optimal)
+    return [
+        {
+            "from_member": members_public[from_id],
+            "to_member": members_public[to_id],
+            "amount": settlement.from_cents(amount),
+        }
+        for from_id, to_id, amount in transfers
+    ]
+
+def project_payments(project_id: uuid.UUID, session: Session, optimal: bool = False) -> list[dict]:
+    # Only the members are needed, their balances are stored
+    version = helper.get_project_version_or_404(project_id, session)
+    return payments_public(project_id, version, member_rows(project_id, session), optimal)
+
+def project_public(project_id: uuid.UUID, session: Session, calculate: models.Calculate = False) -> dict:
+    project = session.exec(
+            select(
+                models.Project.name,
+                models.Project.created_at,
+                models.Project.updated_at,
+                models.Project.version,
+                ).where(models.Project.id == project_id)
+            ).first()
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    name, created_at, updated_at, version = project
+
+    members = member_rows(project_id, session)
+
+    expenses = session.exec(
+            select(
+                models.Expense.member_id,
+                models.Expense.amount,
+                models.Expense.name,
+                models.Expense.order,
+                models.Expense.id,
+                ).where(
+                    models.Expense.project_id == project_id,
+                    ).order_by(models.Expense.member_id, models.Expense.order_key, models.Expense.id)
+            ).all()
+
+    # Involved members in the order of the member list. Older projects can
+    # have links to members of other projects, so they are read with the
+    # links instead of being looked up in the members of this project
+    links = session.exec(
+            select(
+                models.ExpenseMemberLink.expense_id,
+                models.Member.id,
+                models.Member.name,
+                models.Member.order,
+                ).join(
+                    models.Expense, models.Expense.id == models.ExpenseMemberLink.expense_id,
+                    ).join(
+                    models.Member, models.Member.id == models.ExpenseMemberLink.member_id,
+                    ).where(
+                        models.Expense.project_id == project_id,
+                        ).order_by(
+                            models.ExpenseMemberLink.expense_id, models.Member.order_key, models.Member.id)
+            ).all()
+
+    members_public = {
+        member_id: member_public(member_id, member_name, order)
+        for member_id, member_name, order, _ in members
+    }
+    involved = {
+        expense_id: [member_public(member_id, member_name, order) for _, member_id, member_name, order in rows]
+        for expense_id, rows in groupby(links, key=lambda row: row[0])
+    }
+    expenses_by_member = {
+        member_id: [
+            {
+                "amount": amount,
+                "name": expense_name,
+                "order": order,
+                "id": expense_id,
+                "involved_members": involved.get(expense_id, []),
+            }
+            for _, amount, expense_name, order, expense_id in rows
+        ]
+        for member_id, rows in groupby(expenses, key=lambda row: row[0])
+    }
+
+    payments = payments_public(project_id, version, members, calculate == "optimal") if calculate else []
+
+    return {
+        "name": name,
+        "id": project_id,
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "members": [
+            {**public, "expenses": expenses_by_member.get(member_id, [])}
+            for member_id, public in members_public.items()
+        ],
+        "payments": payments,
+    }
+
+def project_summary(project_id: uuid.UUID, version: int, session: Session) -> models.ProjectSummary:
+    # The balances are the maintained balances of the members and the
+    # payments the cached transfers of ?calculate=true, so both endpoints
+    # settle the same amounts. Only the paid totals are aggregated by the
+    # database, in cents as settlement.to_cents rounds every expense, and
+    # the owed amount is what is left of them after the balance
+    members = member_rows(project_id, session)
+    paid = dict(session.exec(
+            select(
+                models.Expense.member_id,
+                func.sum(cast(func.round(models.Expense.amount * 100), BigInteger)),
+                ).where(
+                    models.Expense.project_id == project_id,
+                    ).group_by(models.Expense.member_id)
+            ).all())
+
+    return models.ProjectSummary(
+        id=project_id,
+        members=[
+            models.MemberSummary(
+                **member_public(member_id, name, order),
+                paid=settlement.from_cents(paid.get(member_id) or 0),
+                owed=settlement.from_cents((paid.get(member_id) or 0) - balance),
+                balance=settlement.from_cents(balance),
+            )
+            for member_id, name, order, balance in members
+        ],
+        payments=payments_public(project_id, version, members),
+    )
@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import literal
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, delete, func, insert, select
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from app import models
+from app.database import engine
+from app.demo import demo_project_id
+
+# Retention of anonymous projects: projects not updated for RETENTION_DAYS
+# are deleted, or moved to the *_archive tables with RETENTION_ARCHIVE. The
+# stale projects are processed in batches ordered by id, each in a short
+# transaction of its own, with a pause in between, so the live tables are
+# never locked for long. The demo project is never purged.
+#
+# Runs in the background of the app every RETENTION_INTERVAL seconds, or
+# with: python -m app.cli purge
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the purge
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 0))
+RETENTION_ARCHIVE = os.getenv("RETENTION_ARCHIVE", "false").lower() in ("1", "true", "yes")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 100))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.1))
+# Seconds between background runs, 0 leaves the purge to the CLI
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 3600))
+
+# Archive tables with the query for the rows of a batch of projects, in
+# the order they are copied
+def archived_rows(project_ids: list[uuid.UUID]):
+    return [
+        (models.project_archive, models.Project.__table__,
+         col(models.Project.id).in_(project_ids)),
+        (models.member_archive, models.Member.__table__,
+         col(models.Member.project_id).in_(project_ids)),
+        (models.expense_archive, models.Expense.__table__,
+         col(models.Expense.project_id).in_(project_ids)),
+        (models.expensememberlink_archive, models.ExpenseMemberLink.__table__,
+         col(models.ExpenseMemberLink.expense_id).in_(
+             select(models.Expense.id).where(col(models.Expense.project_id).in_(project_ids)))),
+    ]
+
+@dataclass
+class PurgeReport:
+    projects: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+def stale_project_ids(session: Session, cutoff: datetime, after: uuid.UUID | None, limit: int) -> list[uuid.UUID]:
+    statement = select(models.Project.id).where(
+            models.Project.updated_at < cutoff,
+            ).order_by(models.Project.id).limit(limit)
+    if after:
+        statement = statement.where(models.Project.id > after)
+    if demo_project_id:
+        statement = statement.where(models.Project.id != demo_project_id)
+    return list(session.exec(statement).all())
+
+def purge_batch(session: Session, project_ids: list[uuid.UUID], archive: bool) -> int:
+    # Returns the number of removed rows of all tables. The members,
+    # expenses and links are deleted by ON DELETE CASCADE
+    rows = 0
+    archived_at = datetime.now(timezone.utc)
+    for archive_table, table, where in archived_rows(project_ids):
+        if archive:
+            columns = [column.name for column in table.columns]
+            result = session.exec(
+                insert(archive_table).from_select(
+                    [*columns, "archived_at"],
+                    select(*table.columns, literal(archived_at, archive_table.c.archived_at.type)).where(where),
+                )
+            )
+            rows += result.rowcount
+        else:
+            rows += session.exec(select(func.count()).select_from(table).where(where)).one()
+
+    session.exec(delete(models.Project).where(col(models.Project.id).in_(project_ids)))
+    return rows
+
+def purge_stale_projects(
+        days: int = RETENTION_DAYS,
+        archive: bool = RETENTION_ARCHIVE,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        pause: float = RETENTION_BATCH_PAUSE,
+        dry_run: bool = False) -> PurgeReport:
+
+    report = PurgeReport()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    start = time.perf_counter()
+    after = None
+
+    while True:
+        with Session(engine) as session:
+            project_ids = stale_project_ids(session, cutoff, after, batch_size)
+            if not project_ids:
+                break
+            after = project_ids[-1]
+
+            if dry_run:
+                report.projects += len(project_ids)
+                continue
+            try:
+                rows = purge_batch(session, project_ids, archive)
+                session.commit()
+                report.rows += rows
+                report.projects += len(project_ids)
+            except IntegrityError:
+                # Archived concurrently by another worker, skip the batch
+                session.rollback()
+
+        if pause:
+            time.sleep(pause)
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+async def purge_periodically():
+    # Background task of the app, see main.py
+    while True:
+        try:
+            report = await run_in_threadpool(purge_stale_projects)
+            if report.projects:
+                logger.info("Purged %d stale projects with %d rows (%.0f rows/s)",
+                            report.projects, report.rows, report.rows_per_second)
+        except Exception:
+            logger.exception("Failed to purge stale projects")
+        await asyncio.sleep(RETENTION_INTERVAL)
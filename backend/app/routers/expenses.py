@@ -1,10 +1,12 @@
-from fastapi import Depends, Request
-from sqlmodel import Session, asc, nulls_last, select
+from fastapi import Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, and_, select
+from typing import Literal
 import uuid
 
-from app.database import get_session
+from app.database import Database, get_db
 from app.limiter import limiter
-from app import models, helper
+from app import models, helper, balances, bulk, events
 
 router = helper.get_router()
 
@@ -14,91 +16,197 @@ router = helper.get_router()
 # GET    /projects/{id}/members/{member_id}/expenses/{expense_id} (get an expense by id)
 # PUT    /projects/{id}/members/{member_id}/expenses/{expense_id} (update an expense by id)
 # DELETE /projects/{id}/members/{member_id}/expenses/{expense_id} (delete an expense by id)
+# PUT    /projects/{id}/members/{member_id}/expenses/{expense_id}/move (move an expense between two others)
+
+# POST   /projects/{id}/expenses/import (import expenses from CSV or NDJSON)
+# GET    /projects/{id}/expenses/export (export expenses as CSV or NDJSON)
 
 # Get all expenses for a member
 @router.get("/projects/{id}/members/{member_id}/expenses", response_model=list[models.ExpensePublic])
 @limiter.limit("30/minute")
-def get_all_expenses(
+async def get_all_expenses(
         request: Request,
+        response: Response,
         id: uuid.UUID,
         member_id: uuid.UUID,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
+
+    def get(session: Session):
+        version = helper.get_project_version_or_404(id, session)
+        etag = helper.project_etag(id, version, f"expenses-{member_id.hex}")
+        not_modified = helper.not_modified_or_none(request, response, etag)
+        if not_modified:
+            return not_modified
 
-    expenses = session.exec(
-        select(models.Expense).where(
-            models.Expense.project_id == id,
-            models.Expense.member_id == member_id
-        ).order_by(nulls_last(asc(models.Expense.order)))
-    ).all()
-    return expenses
+        expenses = session.exec(
+            select(models.Expense).where(
+                models.Expense.project_id == id,
+                models.Expense.member_id == member_id
+            ).order_by(models.Expense.order_key, models.Expense.id)
+        ).all()
+        helper.load_involved_members(expenses, models.Expense.member_id == member_id, session)
+        return [models.ExpensePublic.model_validate(expense) for expense in expenses]
+
+    return await db.run(get)
 
 
 # Create a new expense for a member
 @router.post("/projects/{id}/members/{member_id}/expenses", response_model=models.ExpensePublic)
 @limiter.limit("30/minute")
-def create_expense(
+async def create_expense(
         request: Request,
         id: uuid.UUID,
         member_id: uuid.UUID,
         data: models.ExpenseCreate,
-        session: Session = Depends(get_session)):
-
-    create = data.model_dump(exclude_unset=True)
-    create = helper.remodel_involved_members(create, session)
-    expense = models.Expense(**create, project_id=id, member_id=member_id)
-
-    session.add(expense)
-    session.commit()
-    session.refresh(expense)
+        db: Database = Depends(get_db)):
+
+    def create(session: Session):
+        create = data.model_dump(exclude_unset=True)
+        involved_ids = helper.involved_member_ids_or_404(create.pop("involved_members", []), id, session)
+        expense = models.Expense(**create, project_id=id, member_id=member_id)
+
+        session.add(expense)
+        helper.set_involved_members(expense, involved_ids, session, current=[])
+        balances.ExpenseBalance(None, id, session).apply(expense, session)
+        helper.bump_project_version(id, session)
+        session.commit()
+        session.refresh(expense)
+        return models.ExpensePublic.model_validate(expense)
+
+    expense = await db.run(create)
+    await events.publish(id, "expense.created", {"member_id": member_id, **expense.model_dump()})
     return expense
 
 
 # Get an expense by id
 @router.get("/projects/{id}/members/{member_id}/expenses/{expense_id}", response_model=models.ExpensePublic)
 @limiter.limit("30/minute")
-def get_expense(
+async def get_expense(
         request: Request,
+        id: uuid.UUID,
         member_id: uuid.UUID,
         expense_id: uuid.UUID,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
 
-    expense = helper.get_expense_or_404(expense_id, member_id, session)
-    return expense
+    def get(session: Session):
+        return models.ExpensePublic.model_validate(
+            helper.get_expense_or_404(expense_id, member_id, id, session))
+
+    return await db.run(get)
 
 
 # Update an expense by id
 @router.put("/projects/{id}/members/{member_id}/expenses/{expense_id}", response_model=models.ExpensePublic)
 @limiter.limit("30/minute")
-def update_expense(
+async def update_expense(
         request: Request,
+        id: uuid.UUID,
         member_id: uuid.UUID,
         expense_id: uuid.UUID,
         data: models.ExpenseUpdate,
-        session: Session = Depends(get_session)):
-
-    expense = helper.get_expense_or_404(expense_id, member_id, session)
-    update = data.model_dump(exclude_unset=True)
-    update = helper.remodel_involved_members(update, session)
+        db: Database = Depends(get_db)):
+
+    def update(session: Session):
+        expense = helper.get_expense_or_404(expense_id, member_id, id, session)
+        update = data.model_dump(exclude_unset=True)
+        # Missing or null involved members keep the existing ones
+        involved_ids = update.pop("involved_members", None)
+        if involved_ids is not None:
+            involved_ids = helper.involved_member_ids_or_404(involved_ids, id, session)
+
+        tracker = balances.ExpenseBalance(expense, id, session)
+        for key, value in update.items():
+            setattr(expense, key, value)
+
+        session.add(expense)
+        if involved_ids is not None:
+            current = [member.id for member in expense.involved_members]
+            helper.set_involved_members(expense, involved_ids, session, current=current)
+        tracker.apply(expense, session)
+        helper.bump_project_version(id, session)
+        session.commit()
+        session.refresh(expense)
+        return models.ExpensePublic.model_validate(expense)
+
+    expense = await db.run(update)
+    await events.publish(id, "expense.updated", {"member_id": member_id, **expense.model_dump()})
+    return expense
 
-    for key, value in update.items():
-        setattr(expense, key, value)
 
-    session.add(expense)
-    session.commit()
-    session.refresh(expense)
+# Move an expense between two others of the member, only the moved expense is written
+@router.put("/projects/{id}/members/{member_id}/expenses/{expense_id}/move", response_model=models.ExpensePublic)
+@limiter.limit("30/minute")
+async def move_expense(
+        request: Request,
+        id: uuid.UUID,
+        member_id: uuid.UUID,
+        expense_id: uuid.UUID,
+        data: models.MoveRequest,
+        db: Database = Depends(get_db)):
+
+    def move(session: Session):
+        expense = helper.get_expense_or_404(expense_id, member_id, id, session)
+        scope = and_(models.Expense.project_id == id, models.Expense.member_id == member_id)
+        helper.move_entry_or_404(expense, scope, data, session)
+        helper.bump_project_version(id, session)
+        session.commit()
+        session.refresh(expense)
+        return models.ExpensePublic.model_validate(expense)
+
+    expense = await db.run(move)
+    await events.publish(id, "expense.moved", {"member_id": member_id, **expense.model_dump()})
     return expense
 
 
 # Delete an expense by id
 @router.delete("/projects/{id}/members/{member_id}/expenses/{expense_id}", response_model=None, status_code=204)
 @limiter.limit("30/minute")
-def delete_expense(
+async def delete_expense(
         request: Request,
+        id: uuid.UUID,
         member_id: uuid.UUID,
         expense_id: uuid.UUID,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
+
+    def delete(session: Session):
+        expense = helper.get_expense_or_404(expense_id, member_id, id, session)
+        balances.ExpenseBalance(expense, id, session).apply(None, session)
+        session.delete(expense)
+        helper.bump_project_version(id, session)
+        session.commit()
 
-    expense = helper.get_expense_or_404(expense_id, member_id, session)
-    session.delete(expense)
-    session.commit()
+    await db.run(delete)
+    await events.publish(id, "expense.deleted", {"member_id": member_id, "id": expense_id})
     return
+
+
+# Import expenses from a streamed CSV or NDJSON body, in one transaction
+@router.post("/projects/{id}/expenses/import", response_model=models.ExpenseImportResult,
+             openapi_extra={"requestBody": {"required": True, "content": {
+                 "text/csv": {"schema": {"type": "string"}},
+                 "application/x-ndjson": {"schema": {"type": "string"}},
+             }}})
+@limiter.limit("5/minute")
+async def import_expenses(
+        request: Request,
+        id: uuid.UUID,
+        db: Database = Depends(get_db)):
+
+    rows = await bulk.parse_expenses(request.stream(), request.headers.get("content-type"))
+    imported = await db.run(bulk.import_expenses, id, rows)
+    await events.publish(id, "expenses.imported", {"imported": imported})
+    return models.ExpenseImportResult(imported=imported)
+
+
+# Export all expenses of a project, streamed as CSV or NDJSON
+@router.get("/projects/{id}/expenses/export")
+@limiter.limit("5/minute")
+async def export_expenses(
+        request: Request,
+        id: uuid.UUID,
+        format: Literal["csv", "ndjson"] = "csv",
+        db: Database = Depends(get_db)):
+
+    await db.run(lambda session: helper.get_project_version_or_404(id, session))
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(bulk.export_expenses(id, format), media_type=media_type)
@@ -1,10 +1,10 @@
-from fastapi import Depends, Request
+from fastapi import Depends, Request, Response
 from sqlmodel import Session
 import uuid
 
-from app.database import get_session
+from app.database import Database, get_db
 from app.limiter import limiter
-from app import models, helper
+from app import models, helper, balances, events
 
 router = helper.get_router()
 
@@ -14,80 +14,143 @@ router = helper.get_router()
 # GET    /projects/{id}/members/{member_id} (get a member by id)
 # PUT    /projects/{id}/members/{member_id} (update a member by id)
 # DELETE /projects/{id}/members/{member_id} (delete a member by id)
+# PUT    /projects/{id}/members/{member_id}/move (move a member between two others)
 
 # Get all members of a project
 @router.get("/projects/{id}/members", response_model=list[models.MemberPublic])
 @limiter.limit("10/10second")
-def get_all_members(
+async def get_all_members(
         request: Request,
+        response: Response,
         id: uuid.UUID,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
 
-    project = helper.get_project_or_404(id, session)
-    return project.members
+    def get(session: Session):
+        version = helper.get_project_version_or_404(id, session)
+        etag = helper.project_etag(id, version, "members")
+        not_modified = helper.not_modified_or_none(request, response, etag)
+        if not_modified:
+            return not_modified
+
+        project = helper.get_project_or_404(id, session, load_graph=False)
+        return [models.MemberPublic.model_validate(member) for member in project.members]
+
+    return await db.run(get)
 
 
 # Create a new member for a project
 @router.post("/projects/{id}/members", response_model=models.MemberPublicWithExpenses)
 @limiter.limit("30/5minute")
-def create_member(
+async def create_member(
         request: Request,
         id: uuid.UUID,
         data: models.MemberCreate,
-        session: Session = Depends(get_session)):
-
-    member = models.Member(**data.model_dump())
-    member.project_id = id
-
-    session.add(member)
-    session.commit()
-    session.refresh(member)
+        db: Database = Depends(get_db)):
+
+    def create(session: Session):
+        member = models.Member(**data.model_dump())
+        member.project_id = id
+
+        # Expenses without involved members are split over everybody, so a
+        # new member changes the shares of existing expenses
+        deltas = balances.member_addition_deltas(member.id, id, session)
+        session.add(member)
+        session.flush()
+        balances.apply_deltas(deltas, id, session)
+        helper.bump_project_version(id, session)
+        session.commit()
+        session.refresh(member)
+        return models.MemberPublicWithExpenses.model_validate(member)
+
+    member = await db.run(create)
+    await events.publish(id, "member.created", member)
     return member
 
 
 # Get a member by id
 @router.get("/projects/{id}/members/{member_id}", response_model=models.MemberPublic)
 @limiter.limit("10/10second")
-def get_member(
+async def get_member(
         request: Request,
         id: uuid.UUID,
         member_id: uuid.UUID,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
+
+    def get(session: Session):
+        return models.MemberPublic.model_validate(
+            helper.get_member_or_404(member_id, id, session))
 
-    return helper.get_member_or_404(member_id, id, session)
+    return await db.run(get)
 
 
 # Update a member by id
 @router.put("/projects/{id}/members/{member_id}", response_model=models.MemberPublic)
 @limiter.limit("30/minute")
-def update_member(
+async def update_member(
         request: Request,
         id: uuid.UUID,
         member_id: uuid.UUID,
         data: models.MemberUpdate,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
+
+    def update(session: Session):
+        member = helper.get_member_or_404(member_id, id, session)
+        update = data.model_dump(exclude_unset=True)
+        for key, value in update.items():
+            setattr(member, key, value)
+
+        session.add(member)
+        helper.bump_project_version(id, session)
+        session.commit()
+        session.refresh(member)
+        return models.MemberPublic.model_validate(member)
+
+    member = await db.run(update)
+    await events.publish(id, "member.updated", member)
+    return member
 
-    member = helper.get_member_or_404(member_id, id, session)
-    update = data.model_dump(exclude_unset=True)
-    for key, value in update.items():
-        setattr(member, key, value)
 
-    session.add(member)
-    session.commit()
-    session.refresh(member)
+# Move a member between two others, only the moved member is written
+@router.put("/projects/{id}/members/{member_id}/move", response_model=models.MemberPublic)
+@limiter.limit("30/minute")
+async def move_member(
+        request: Request,
+        id: uuid.UUID,
+        member_id: uuid.UUID,
+        data: models.MoveRequest,
+        db: Database = Depends(get_db)):
+
+    def move(session: Session):
+        member = helper.get_member_or_404(member_id, id, session)
+        helper.move_entry_or_404(member, models.Member.project_id == id, data, session)
+        helper.bump_project_version(id, session)
+        session.commit()
+        session.refresh(member)
+        return models.MemberPublic.model_validate(member)
+
+    member = await db.run(move)
+    await events.publish(id, "member.moved", member)
     return member
 
 
 # Delete a member by id
 @router.delete("/projects/{id}/members/{member_id}", response_model=None, status_code=204)
 @limiter.limit("30/minute")
-def delete_member(
+async def delete_member(
         request: Request,
         id: uuid.UUID,
         member_id: uuid.UUID,
-        session: Session = Depends(get_session)):
-
-    member = helper.get_member_or_404(member_id, id, session)
-    session.delete(member)
-    session.commit()
+        db: Database = Depends(get_db)):
+
+    def delete(session: Session):
+        # The balance changes are read before the cascade removes the
+        # expenses and links of the member
+        deltas = balances.member_removal_deltas(member_id, id, session)
+        helper.delete_member_or_404(member_id, id, session)
+        balances.apply_deltas(deltas, id, session)
+        helper.bump_project_version(id, session)
+        session.commit()
+
+    await db.run(delete)
+    await events.publish(id, "member.deleted", {"id": member_id})
     return
@@ -0,0 +1,13 @@
+from fastapi import Depends
+from fastapi.responses import PlainTextResponse
+
+from app import helper, metrics
+
+router = helper.get_router()
+
+# GET    /metrics (request, database and rate limit metrics in the Prometheus text format)
+
+# Metrics of this worker process, protected by the basic auth credentials
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(_: str = Depends(helper.authenticated_or_401)):
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
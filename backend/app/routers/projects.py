@@ -1,10 +1,14 @@
-from fastapi import Depends, Request
+from fastapi import Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
+from datetime import datetime
+from typing import Literal
 import uuid
 
-from app.database import get_session
+from app.database import Database, engine, get_db
 from app.limiter import limiter
-from app import models, helper
+from app import models, helper, batch, demo, events, readmodel
 
 router = helper.get_router()
 
@@ -13,89 +17,238 @@ router = helper.get_router()
 # DELETE /projects (delete all projects)
 
 # GET    /projects/{id} (get a project by id)
+# GET    /projects/{id}/summary (get the balances and payments of a project)
 # PUT    /projects/{id} (update a project by id)
 # DELETE /projects/{id} (delete a project by id)
 
-# Get all projects and optionally calculate payments
+# POST   /projects/{id}/batch (apply multiple member and expense changes at once)
+# GET    /projects/{id}/events (stream change notifications as Server-Sent Events)
+
+# POST   /demo/reload (reload the in-memory snapshot of the demo project)
+
+# Get all projects, paginated by cursor or streamed as NDJSON
 @router.get("/projects", response_model=list[models.ProjectPublicAll])
 @limiter.limit("5/minute")
-def get_all_projects(
+async def get_all_projects(
         request: Request,
+        response: Response,
+        limit: int = Query(default=100, ge=1, le=1000),
+        cursor: uuid.UUID | None = None,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None,
+        updated_after: datetime | None = None,
+        updated_before: datetime | None = None,
+        format: Literal["json", "ndjson"] = "json",
         _: str = Depends(helper.authenticated_or_401),
-        session: Session = Depends(get_session)):
-
-    projects = session.exec(select(models.Project)).all()
+        db: Database = Depends(get_db)):
+
+    # Keyset pagination on the primary key: uuid7 ids are time-ordered,
+    # so the next page starts right after the last id of the previous one
+    statement = select(
+            models.Project.id,
+            models.Project.name,
+            models.Project.created_at,
+            models.Project.updated_at,
+            ).order_by(models.Project.id)
+
+    if cursor:
+        statement = statement.where(models.Project.id > cursor)
+    if created_after:
+        statement = statement.where(models.Project.created_at >= created_after)
+    if created_before:
+        statement = statement.where(models.Project.created_at < created_before)
+    if updated_after:
+        statement = statement.where(models.Project.updated_at >= updated_after)
+    if updated_before:
+        statement = statement.where(models.Project.updated_at < updated_before)
+
+    if format == "ndjson":
+        return StreamingResponse(stream_projects(statement), media_type="application/x-ndjson")
+
+    def get(session: Session):
+        return [
+            models.ProjectPublicAll.model_validate(row._mapping)
+            for row in session.exec(statement.limit(limit)).all()
+        ]
+
+    projects = await db.run(get)
+    if len(projects) == limit:
+        response.headers["X-Next-Cursor"] = str(projects[-1].id)
     return projects
 
 
+def stream_projects(statement):
+    # The response outlives the request session, so use an own one. With
+    # yield_per the rows are fetched through a server-side cursor in
+    # chunks, which keeps the memory usage constant
+    with Session(engine) as session:
+        rows = session.exec(statement.execution_options(yield_per=1000))
+        for row in rows:
+            yield models.ProjectPublicAll.model_validate(row._mapping).model_dump_json() + "\n"
+
+
 # Create a new project
 @router.post("/projects", response_model=models.ProjectPublic)
 @limiter.limit("2/minute")
-def create_project(
+async def create_project(
         request: Request,
         data: models.ProjectCreate,
         member_count: int = 0,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
 
-    project = models.Project(**data.model_dump())
-    # Quickly add new members to the project
-    for _ in range(member_count):
-        member = models.Member(project_id=project.id)
-        project.members.append(member)
+    def create(session: Session):
+        project = models.Project(**data.model_dump())
+        # Quickly add new members to the project
+        for _ in range(member_count):
+            member = models.Member(project_id=project.id)
+            project.members.append(member)
 
-    session.add(project)
-    session.commit()
-    session.refresh(project)
-    return project
+        session.add(project)
+        session.commit()
+        session.refresh(project)
+        return models.ProjectPublic.model_validate(project)
+
+    return await db.run(create)
 
 
 # Get a project by id
 @router.get("/projects/{id}", response_model=models.ProjectPublic)
 @limiter.limit("10/10second")
-def get_project(
+async def get_project(
         request: Request,
+        response: Response,
         id: uuid.UUID,
-        calculate: bool = False,
-        session: Session = Depends(get_session)):
+        calculate: models.Calculate = False,
+        db: Database = Depends(get_db)):
+
+    # The demo project is served from memory, see demo.py
+    if id == demo.demo_project_id:
+        cached = demo.snapshot.response(request, calculate)
+        if cached:
+            return cached
+
+    def get(session: Session):
+        # Answer conditional requests before loading members and expenses
+        version = helper.get_project_version_or_404(id, session)
+        variant = "optimal" if calculate == "optimal" else "calculate" if calculate else ""
+        etag = helper.project_etag(id, version, variant)
+        not_modified = helper.not_modified_or_none(request, response, etag)
+        if not_modified:
+            return not_modified
+
+        # Plain rows rendered with orjson, returning the response directly
+        # also skips the validation against the response model
+        return readmodel.ProjectResponse(
+            readmodel.project_public(id, session, calculate), headers=dict(response.headers))
+
+    return await db.run(get)
+
+
+# Get the balances and payments of a project from the stored balances,
+# without loading the expenses
+@router.get("/projects/{id}/summary", response_model=models.ProjectSummary)
+@limiter.limit("10/10second")
+async def get_project_summary(
+        request: Request,
+        response: Response,
+        id: uuid.UUID,
+        db: Database = Depends(get_db)):
 
-    project = helper.get_project_or_404(id, session)
-    project_public = models.ProjectPublic.model_validate(project)
+    def get(session: Session):
+        version = helper.get_project_version_or_404(id, session)
+        etag = helper.project_etag(id, version, "summary")
+        not_modified = helper.not_modified_or_none(request, response, etag)
+        if not_modified:
+            return not_modified
 
-    if calculate:
-        project_public.payments = helper.calculate_project_payments(project)
+        return readmodel.project_summary(id, version, session)
 
-    return project_public
+    return await db.run(get)
 
 
 # Update a project by id
 @router.put("/projects/{id}", response_model=models.ProjectPublic)
 @limiter.limit("10/10second")
-def update_project(
+async def update_project(
         request: Request,
         id: uuid.UUID,
         data: models.ProjectUpdate,
-        session: Session = Depends(get_session)):
-
-    project = helper.get_project_or_404(id, session)
-    update = data.model_dump(exclude_unset=True)
-    for key, value in update.items():
-        setattr(project, key, value)
-
-    session.add(project)
-    session.commit()
-    session.refresh(project)
+        db: Database = Depends(get_db)):
+
+    def update(session: Session):
+        project = helper.get_project_or_404(id, session, load_graph=False)
+        update = data.model_dump(exclude_unset=True)
+        for key, value in update.items():
+            setattr(project, key, value)
+
+        session.add(project)
+        helper.bump_project_version(id, session)
+        session.commit()
+        # Only the response needs the members and expenses
+        return models.ProjectPublic.model_validate(helper.get_project_or_404(id, session))
+
+    project = await db.run(update)
+    await events.publish(id, "project.updated", models.ProjectPublicAll.model_validate(project))
     return project
 
 
 # Delete a project
 @router.delete("/projects/{id}", response_model=None, status_code=204)
 @limiter.limit("2/minute")
-def delete_project(
+async def delete_project(
         request: Request,
         id: uuid.UUID,
-        session: Session = Depends(get_session)):
+        db: Database = Depends(get_db)):
+
+    def delete(session: Session):
+        helper.delete_project_or_404(id, session)
+        session.commit()
+
+    await db.run(delete)
+    await events.publish(id, "project.deleted")
+    return
+
+
+# Apply multiple member and expense changes in one transaction
+@router.post("/projects/{id}/batch", response_model=models.BatchResult)
+@limiter.limit("10/minute")
+async def batch_project(
+        request: Request,
+        id: uuid.UUID,
+        data: models.BatchRequest,
+        db: Database = Depends(get_db)):
+
+    result = await db.run(batch.apply_batch, id, data)
+    await events.publish(id, "project.batch", {"operations": len(data.operations), "ids": result.ids})
+    return result
+
+
+# Stream change notifications of a project as Server-Sent Events
+@router.get("/projects/{id}/events")
+@limiter.limit("10/minute")
+async def project_events(
+        request: Request,
+        id: uuid.UUID,
+        settlement: bool = False,
+        db: Database = Depends(get_db)):
+
+    await db.run(lambda session: helper.get_project_version_or_404(id, session))
+    return StreamingResponse(events.hub.stream(id, settlement), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Don't let nginx buffer the events
+        "X-Accel-Buffering": "no",
+    })
+
+
+# Reload the in-memory snapshot of the demo project in all workers
+@router.post("/demo/reload", response_model=None, status_code=204)
+@limiter.limit("2/minute")
+async def reload_demo(
+        request: Request,
+        _: str = Depends(helper.authenticated_or_401)):
 
-    project = helper.get_project_or_404(id, session)
-    session.delete(project)
-    session.commit()
+    if not await run_in_threadpool(demo.snapshot.reload):
+        raise HTTPException(status_code=404, detail="Demo project not found")
+    # The other workers reload through the event broadcast
+    await events.publish(demo.demo_project_id, "demo.reloaded")
     return
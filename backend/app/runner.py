@@ -0,0 +1,180 @@
+# Production server: a supervisor process imports the app once, binds the
+# socket and forks the workers, which share the preloaded code and serve
+# the socket with uvicorn. uvloop and httptools are used when installed.
+#
+#   python -m app.runner --host 0.0.0.0 --port 8080 --workers 4
+#
+# Signals to the supervisor:
+#   SIGTERM, SIGINT  graceful shutdown of all workers
+#   SIGHUP           graceful restart, one worker after the other
+#
+# Workers that exit unexpectedly are replaced. Restarted workers fork from
+# the preloaded app, so code changes need a restart of the supervisor.
+#
+# Rate limits and events are kept per process by default. With more than
+# one worker, the rate limit counters default to a SQLite file shared by the
+# workers, and a shared event broadcast (EVENTS_BROADCAST_URL) is required.
+# Only one of the workers runs the retention purge.
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+# Number of worker processes, 0 for one per CPU
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1)) or os.cpu_count() or 1
+
+# Seconds a worker gets to finish its requests after SIGTERM
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+class Supervisor:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.workers: set[int] = set()
+        # The worker running the retention purge
+        self.purger: int | None = None
+        self.stopping = False
+        self.restarting = False
+
+        self.socket = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((args.host, args.port))
+        self.socket.listen(args.backlog)
+        self.socket.set_inheritable(True)
+
+        # Preload the app, every worker gets a copy of it
+        from app.main import app
+        self.config = uvicorn.Config(
+            app, loop="auto", http="auto", log_level=args.log_level,
+            proxy_headers=True, forwarded_allow_ips=args.forwarded_allow_ips,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        )
+
+    def spawn(self, purger: bool = False) -> int:
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker(purger)
+        self.workers.add(pid)
+        if purger:
+            self.purger = pid
+        return pid
+
+    def run_worker(self, purger: bool):
+        # uvicorn installs its own signal handlers
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        if not purger:
+            from app import retention
+            retention.RETENTION_INTERVAL = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        finally:
+            os._exit(0)
+
+    def stop_worker(self, pid: int):
+        # Ask for a graceful shutdown, kill the worker if it takes too long
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while time.monotonic() < deadline:
+            finished, _ = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                self.workers.discard(pid)
+                return
+            time.sleep(0.1)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        self.workers.discard(pid)
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_restart(self, signum, frame):
+        self.restarting = True
+
+    def restart(self):
+        # Replace the workers one by one, so the socket is always served
+        for pid in list(self.workers):
+            self.spawn(purger=pid == self.purger)
+            self.stop_worker(pid)
+
+    def reap(self):
+        # Replace workers that exited on their own
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if not self.stopping:
+                    print(f"Worker {pid} exited with status {status}, starting a new one", file=sys.stderr)
+                    self.spawn(purger=pid == self.purger)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_restart)
+
+        for index in range(self.args.workers):
+            self.spawn(purger=index == 0)
+        print(f"Serving on {self.args.host}:{self.args.port} with {self.args.workers} workers", file=sys.stderr)
+
+        while not self.stopping:
+            if self.restarting:
+                self.restarting = False
+                self.restart()
+            self.reap()
+            time.sleep(0.2)
+
+        # Signal all workers first, so they shut down in parallel
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.discard(pid)
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        self.socket.close()
+
+def configure_shared_state(workers: int):
+    # Runs before the app is imported, which reads the settings
+    if workers == 1:
+        return
+    os.environ.setdefault("RATELIMIT_STORAGE_URI", "sqlite:///ratelimit.db")
+    if os.environ["RATELIMIT_STORAGE_URI"].startswith("memory://"):
+        sys.exit(f"RATELIMIT_STORAGE_URI=memory:// gives each of the {workers} workers its own "
+                 "rate limits, use a sqlite:// or redis:// storage")
+    if os.getenv("EVENTS_BROADCAST_URL", "memory://").startswith("memory://"):
+        sys.exit(f"Events would only reach the clients of one of the {workers} workers, "
+                 "set EVENTS_BROADCAST_URL to a redis:// server or run a single worker")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.runner")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    args = parser.parse_args()
+    configure_shared_state(args.workers)
+
+    if args.workers == 1:
+        # Nothing to supervise
+        from app.main import app
+        uvicorn.run(app, host=args.host, port=args.port, loop="auto", http="auto",
+                    log_level=args.log_level, proxy_headers=True,
+                    forwarded_allow_ips=args.forwarded_allow_ips,
+                    timeout_graceful_shutdown=GRACEFUL_TIMEOUT)
+        return
+
+    Supervisor(args).run()
+
+if __name__ == "__main__":
+    main()
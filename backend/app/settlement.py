@@ -0,0 +1,178 @@
+from collections.abc import Hashable, Iterable, Sequence
+from decimal import Decimal, ROUND_HALF_UP
+import heapq
+import time
+
+# Settlement engine, working on plain values in integer minor units (cents).
+# It doesn't know about the ORM, so it can be used, benchmarked and tested
+# on its own.
+
+# (member_id, paid, owed) in cents
+Entry = tuple[Hashable, int, int]
+# (from_member_id, to_member_id, amount) in cents
+Transfer = tuple[Hashable, Hashable, int]
+
+def to_cents(amount: float | None) -> int:
+    # Go through the decimal representation, so 0.29 becomes 29 and not 28
+    return int(Decimal(str(amount or 0)).scaleb(2).quantize(Decimal(1), ROUND_HALF_UP))
+
+def from_cents(cents: int) -> float:
+    return cents / 100
+
+def split(amount: int, member_ids: Sequence[Hashable], seed: int = 0) -> list[tuple[Hashable, int]]:
+    # Split an amount into equal parts. The remaining cents are handed out
+    # one by one, starting at a position derived from the seed, so the same
+    # input always gives the same split and no member is always the one
+    # paying the extra cent.
+    if not member_ids:
+        return []
+
+    ids = sorted(member_ids)
+    part, remainder = divmod(amount, len(ids))
+    start = seed % len(ids)
+
+    shares = []
+    for index, member_id in enumerate(ids):
+        extra = 1 if (index - start) % len(ids) < remainder else 0
+        shares.append((member_id, part + extra))
+    return shares
+
+def compute_balances(entries: Iterable[Entry]) -> dict[Hashable, int]:
+    balances: dict[Hashable, int] = {}
+    for member_id, paid, owed in entries:
+        balances[member_id] = balances.get(member_id, 0) + paid - owed
+
+    # The balances have to cancel out exactly. If the input doesn't (e.g.
+    # owed shares rounded independently), spread the difference cent by
+    # cent over the members in id order.
+    residual = sum(balances.values())
+    if residual and balances:
+        ids = sorted(balances)
+        step = -1 if residual > 0 else 1
+        for index in range(abs(residual)):
+            balances[ids[index % len(ids)]] += step
+    return balances
+
+def settle_balances(balances: dict[Hashable, int]) -> list[Transfer]:
+    # Always match the largest debtor with the largest creditor. Every
+    # transfer settles at least one of both, so there are at most n-1
+    # transfers, and with the heaps this runs in O(n log n).
+    # The index is the tie-breaker, which keeps the result deterministic.
+    debtors = []
+    creditors = []
+    for index, member_id in enumerate(sorted(balances)):
+        balance = balances[member_id]
+        if balance < 0:
+            debtors.append((balance, index, member_id))
+        elif balance > 0:
+            creditors.append((-balance, index, member_id))
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors and creditors:
+        debt, debtor_index, debtor = heapq.heappop(debtors)
+        credit, creditor_index, creditor = heapq.heappop(creditors)
+
+        amount = min(-debt, -credit)
+        transfers.append((debtor, creditor, amount))
+
+        if debt + amount < 0:
+            heapq.heappush(debtors, (debt + amount, debtor_index, debtor))
+        if credit + amount < 0:
+            heapq.heappush(creditors, (credit + amount, creditor_index, creditor))
+    return transfers
+
+class BudgetExceeded(Exception):
+    pass
+
+def pair_opposites(balances: dict[Hashable, int]) -> tuple[list[list[Hashable]], list[Hashable]]:
+    # Members with exactly opposite balances are a group of their own in
+    # some optimal settlement, so they can be split off before the search.
+    # Returns the pairs and the remaining members with a balance.
+    pairs = []
+    unmatched: dict[int, list[Hashable]] = {}
+    for member_id in sorted(balances):
+        balance = balances[member_id]
+        if not balance:
+            continue
+        if unmatched.get(-balance):
+            pairs.append([unmatched[-balance].pop(0), member_id])
+        else:
+            unmatched.setdefault(balance, []).append(member_id)
+    rest = sorted(member_id for member_ids in unmatched.values() for member_id in member_ids)
+    return pairs, rest
+
+def zero_sum_groups(balances: dict[Hashable, int], member_ids: list[Hashable],
+                    deadline: float) -> list[list[Hashable]]:
+    # Partition the members into the maximum number of groups whose
+    # balances cancel out, by dynamic programming over all subsets:
+    # groups[mask] is the maximum number of zero-sum groups the members of
+    # mask can be split into, if the sum of mask is zero. Each member is
+    # a bit of the mask, so this takes O(2^n * n) time and O(2^n) memory.
+    # Raises BudgetExceeded once the CPU time of the thread passes the deadline.
+    values = [balances[member_id] for member_id in member_ids]
+    full = (1 << len(values)) - 1
+    sums = [0] * (full + 1)
+    groups = [0] * (full + 1)
+
+    for mask in range(1, full + 1):
+        if not mask & 0x3FF and time.thread_time() > deadline:
+            raise BudgetExceeded
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + values[low.bit_length() - 1]
+        best = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if groups[mask ^ bit] > best:
+                best = groups[mask ^ bit]
+            rest ^= bit
+        groups[mask] = best + (sums[mask] == 0)
+
+    # Walk back from all members, removing one member at a time without
+    # losing a group. Every zero-sum subset on the way closes a group.
+    result = []
+    mask = boundary = full
+    while mask:
+        rest = mask
+        best_bit = 0
+        while rest:
+            bit = rest & -rest
+            if not best_bit or groups[mask ^ bit] > groups[mask ^ best_bit]:
+                best_bit = bit
+            rest ^= bit
+        mask ^= best_bit
+        if sums[mask] == 0:
+            group = boundary ^ mask
+            result.append([member_id for index, member_id in enumerate(member_ids) if group >> index & 1])
+            boundary = mask
+    return result
+
+def settle_optimal(balances: dict[Hashable, int], budget: float = 0.2,
+                   max_members: int = 20) -> list[Transfer]:
+    # Settle with the minimum number of transfers. A group of k members
+    # whose balances cancel out needs k-1 transfers, so the minimum is the
+    # number of members with a balance minus the maximum number of disjoint
+    # zero-sum groups. Finding those is NP-hard, so the search is only done
+    # for up to max_members members (after pairing opposite balances) and
+    # within budget seconds of CPU time of the calling thread, as other
+    # requests run in other threads. Otherwise, this falls back to
+    # settle_balances, which needs up to n-1 transfers.
+    pairs, rest = pair_opposites(balances)
+    if len(rest) > max_members:
+        return settle_balances(balances)
+    try:
+        groups = pairs + zero_sum_groups(balances, rest, time.thread_time() + budget)
+    except BudgetExceeded:
+        return settle_balances(balances)
+
+    # Within a group without a zero-sum subgroup, the greedy matching needs
+    # exactly k-1 transfers
+    transfers = []
+    for group in groups:
+        transfers.extend(settle_balances({member_id: balances[member_id] for member_id in group}))
+    return transfers
+
+def settle(entries: Iterable[Entry]) -> list[Transfer]:
+    return settle_balances(compute_balances(entries))
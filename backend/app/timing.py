@@ -0,0 +1,35 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+# Timings of the current request, collected by the instrumentation
+# middleware (see metrics.py). The context is copied into the threadpool
+# and the tasks of the request, which all share the same object. Outside
+# of requests there are no timings and nothing is recorded.
+
+class RequestTimings:
+    __slots__ = ("queries", "spans")
+
+    def __init__(self):
+        self.queries = 0
+        # Seconds per span name, e.g. db, settlement or serialize
+        self.spans: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+request_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
@@ -0,0 +1,87 @@
+# Compare the request throughput of the sync and the async database mode at
+# high concurrency. Each mode runs in its own process against a fresh SQLite
+# database, with the requests sent in-process through the ASGI transport.
+#
+#   python -m benchmarks.async_throughput --requests 2000 --concurrency 200
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run_worker(args: argparse.Namespace):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.database import init_db
+    from app.limiter import limiter
+    from app.main import app
+
+    limiter.enabled = False
+    init_db()
+
+    async def main() -> float:
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            response = await client.post(
+                "/api/projects", params={"member_count": 8}, json={"name": "benchmark"})
+            response.raise_for_status()
+            project_id = response.json()["id"]
+
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def request():
+                async with semaphore:
+                    response = await client.get(f"/api/projects/{project_id}")
+                    response.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(request() for _ in range(args.requests)))
+            return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    print(json.dumps({
+        "requests": args.requests,
+        "seconds": elapsed,
+        "requests_per_second": args.requests / elapsed,
+    }))
+
+
+def run_mode(args: argparse.Namespace, mode: str) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{directory}/benchmark.db",
+            DATABASE_ASYNC="true" if mode == "async" else "false",
+        )
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.async_throughput", "--worker",
+             "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+            env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.async_throughput")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    for mode in ("sync", "async"):
+        result = run_mode(args, mode)
+        print(f"{mode:>6}: {result['requests_per_second']:8.1f} req/s "
+              f"({result['seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
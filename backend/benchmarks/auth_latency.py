@@ -0,0 +1,44 @@
+# Measure the latency of the basic auth check on GET /api/projects, with and
+# without the cache of verified credentials.
+#
+#   python -m benchmarks.auth_latency --requests 50
+
+import argparse
+import os
+import time
+
+import bcrypt
+
+# The credentials have to be set before the helper module is imported
+os.environ["BASIC_AUTH"] = "admin:" + bcrypt.hashpw(b"admin", bcrypt.gensalt(12)).decode()
+
+from fastapi.security import HTTPBasicCredentials # noqa: E402
+
+from app import helper # noqa: E402
+
+
+def measure(requests: int, cached: bool) -> float:
+    credentials = HTTPBasicCredentials(username="admin", password="admin")
+    helper.credentials_cache.clear()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        if not cached:
+            helper.credentials_cache.clear()
+        helper.authenticated_or_401(credentials)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.auth_latency")
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    for cached in (False, True):
+        seconds = measure(args.requests, cached)
+        label = "cached" if cached else "bcrypt"
+        print(f"{label:>6}: {seconds * 1e3:10.3f} ms per request")
+
+
+if __name__ == "__main__":
+    main()
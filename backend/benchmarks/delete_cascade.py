@@ -0,0 +1,93 @@
+# Check that deleting a member or a project issues a constant number of
+# statements, however large the project is, and that the database removes
+# all dependent rows. Exits with status 1 if a check fails.
+#
+#   python -m benchmarks.delete_cascade --expenses 5000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# The database has to be set before the database module is imported
+directory = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{directory.name}/benchmark.db"
+
+from fastapi.testclient import TestClient # noqa: E402
+from sqlalchemy import event # noqa: E402
+from sqlmodel import Session, func, select # noqa: E402
+
+from app import models # noqa: E402
+from app.database import engine # noqa: E402
+from app.limiter import limiter # noqa: E402
+from app.main import app # noqa: E402
+from benchmarks.generator import ProjectSpec, generate_project # noqa: E402
+
+# The member delete reads the members, the affected expenses and their
+# links to calculate the balance changes, then deletes and updates
+MAX_MEMBER_DELETE_STATEMENTS = 8
+MAX_PROJECT_DELETE_STATEMENTS = 3
+
+
+def count_rows(model, **filters) -> int:
+    with Session(engine) as session:
+        statement = select(func.count()).select_from(model)
+        for column, value in filters.items():
+            statement = statement.where(getattr(model, column) == value)
+        return session.exec(statement).one()
+
+
+def measure(client: TestClient, path: str) -> tuple[int, float]:
+    statements = []
+
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    start = time.perf_counter()
+    try:
+        response = client.delete(path)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return len(statements), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.delete_cascade")
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--expenses", type=int, default=5000)
+    args = parser.parse_args()
+
+    limiter.enabled = False
+    failures = []
+    with TestClient(app) as client:
+        with Session(engine) as session:
+            project_id = generate_project(session, ProjectSpec(
+                members=args.members, expenses=args.expenses, density=0.5, seed=22))
+        member_id = uuid.UUID(client.get(f"/api/projects/{project_id}/members").json()[0]["id"])
+
+        count, elapsed = measure(client, f"/api/projects/{project_id}/members/{member_id}")
+        print(f"member delete:  {count:3} statements, {elapsed * 1000:8.1f} ms")
+        if count > MAX_MEMBER_DELETE_STATEMENTS:
+            failures.append(f"member delete issued {count} statements")
+        if count_rows(models.Expense, member_id=member_id) or count_rows(models.ExpenseMemberLink, member_id=member_id):
+            failures.append("member delete left expenses or links behind")
+
+        count, elapsed = measure(client, f"/api/projects/{project_id}")
+        print(f"project delete: {count:3} statements, {elapsed * 1000:8.1f} ms")
+        if count > MAX_PROJECT_DELETE_STATEMENTS:
+            failures.append(f"project delete issued {count} statements")
+        if count_rows(models.Member) or count_rows(models.Expense) or count_rows(models.ExpenseMemberLink):
+            failures.append("project delete left members, expenses or links behind")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
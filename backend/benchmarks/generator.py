@@ -0,0 +1,81 @@
+# Seeded generator of synthetic projects. The same seed and sizes always
+# produce the same project, including all ids, so runs are comparable.
+#
+# The rows are written with multi-row INSERTs and the balances are stored
+# as the routers would, so the projects are consistent for all endpoints.
+
+from dataclasses import dataclass
+from sqlmodel import Session, insert
+import random
+import uuid
+
+from app import models, balances, ordering
+
+
+@dataclass(frozen=True)
+class ProjectSpec:
+    members: int = 8
+    expenses: int = 100
+    # Probability of a member to be involved in an expense. Expenses
+    # without any involved member are split over everybody
+    density: float = 0.5
+    seed: int = 0
+
+
+def seeded_uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def generate_project(session: Session, spec: ProjectSpec) -> uuid.UUID:
+    rng = random.Random(spec.seed)
+    project_id = seeded_uuid(rng)
+    session.add(models.Project(id=project_id, name=f"benchmark {spec.seed}"))
+    session.flush()
+
+    member_ids = [seeded_uuid(rng) for _ in range(spec.members)]
+    session.exec(insert(models.Member), params=[
+        {
+            "id": member_id,
+            "project_id": project_id,
+            "name": f"member {index}",
+            "order": index,
+            "order_key": ordering.index_key(index),
+            "balance_cents": 0,
+        }
+        for index, member_id in enumerate(member_ids)
+    ])
+
+    expenses = []
+    links = []
+    deltas: dict[uuid.UUID, int] = {}
+    positions = dict.fromkeys(member_ids, 0)
+    for index in range(spec.expenses):
+        expense_id = seeded_uuid(rng)
+        payer_id = rng.choice(member_ids)
+        involved_ids = [member_id for member_id in member_ids if rng.random() < spec.density]
+        amount = rng.randint(100, 50000) / 100
+
+        position = positions[payer_id]
+        positions[payer_id] += 1
+        expenses.append({
+            "id": expense_id,
+            "project_id": project_id,
+            "member_id": payer_id,
+            "amount": amount,
+            "name": f"expense {index}",
+            "order": position,
+            "order_key": ordering.index_key(position),
+        })
+        links.extend({"expense_id": expense_id, "member_id": member_id} for member_id in involved_ids)
+
+        contributions = balances.expense_contributions(expense_id, amount, payer_id, involved_ids, member_ids)
+        for member_id, contribution in contributions.items():
+            deltas[member_id] = deltas.get(member_id, 0) + contribution
+
+    if expenses:
+        session.exec(insert(models.Expense), params=expenses)
+    if links:
+        session.exec(insert(models.ExpenseMemberLink), params=links)
+    balances.apply_deltas(deltas, project_id, session)
+    session.commit()
+    return project_id
@@ -0,0 +1,49 @@
+# Measure the rate limiter overhead per request for the available storages,
+# with the limit and strategy used by the routers.
+#
+#   python -m benchmarks.limiter_overhead --hits 20000
+#   python -m benchmarks.limiter_overhead --redis redis://localhost:6379
+
+import argparse
+import tempfile
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+
+from app import ratelimit # noqa: F401
+from app.limiter import RATELIMIT_STRATEGY
+
+
+def measure(uri: str, hits: int, clients: int) -> float:
+    limiter = STRATEGIES[RATELIMIT_STRATEGY](storage_from_string(uri))
+    limit = parse("10/10second")
+    limiter.hit(limit, "warmup")
+
+    start = time.perf_counter()
+    for index in range(hits):
+        limiter.hit(limit, f"client-{index % clients}")
+    return (time.perf_counter() - start) / hits
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.limiter_overhead")
+    parser.add_argument("--hits", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--redis", help="redis:// uri of a server (or a local stand-in) to include")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uris = ["memory://", f"sqlite:///{directory}/ratelimit.db"]
+        if args.redis:
+            uris.append(args.redis)
+
+        print(f"{RATELIMIT_STRATEGY}, {args.hits} hits from {args.clients} clients")
+        for uri in uris:
+            seconds = measure(uri, args.hits, args.clients)
+            print(f"{uri.split('://')[0]:>8}: {seconds * 1e6:8.1f} µs per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Compare the ORM read path of the project detail (SQLModel objects, the
+# public model and the response model validation, json rendering) with the
+# row based read model rendered by orjson, for projects of different sizes.
+#
+#   python -m benchmarks.project_read --repeat 50
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+# The database has to be set before the database module is imported
+directory = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{directory.name}/benchmark.db"
+
+from fastapi.responses import JSONResponse # noqa: E402
+from pydantic import TypeAdapter # noqa: E402
+from sqlmodel import Session # noqa: E402
+
+from app import models, helper, balances, readmodel # noqa: E402
+from app.database import engine, init_db # noqa: E402
+
+MEMBERS = 8
+
+
+def create_project(expense_count: int) -> uuid.UUID:
+    rng = random.Random(expense_count)
+    with Session(engine) as session:
+        project = models.Project(name=f"{expense_count} expenses")
+        members = [models.Member(name=f"member {index}", project=project) for index in range(MEMBERS)]
+        for index in range(expense_count):
+            payer = rng.choice(members)
+            models.Expense(
+                name=f"expense {index}",
+                amount=rng.randint(100, 100000) / 100,
+                project=project,
+                member=payer,
+                involved_members=rng.sample(members, rng.randint(1, MEMBERS)),
+            )
+        session.add(project)
+        session.flush()
+        balances.recompute_project_balances(project.id, session, repair=True)
+        session.commit()
+        return project.id
+
+
+def orm_path(project_id: uuid.UUID) -> bytes:
+    with Session(engine) as session:
+        project = helper.get_project_or_404(project_id, session)
+        project_public = models.ProjectPublic.model_validate(project)
+        project_public.payments = helper.calculate_project_payments(project)
+
+        # Validation against the response model and rendering, as done by
+        # FastAPI for returned models
+        adapter = TypeAdapter(models.ProjectPublic)
+        value = adapter.validate_python(project_public, from_attributes=True)
+        return JSONResponse(adapter.dump_python(value, mode="json")).body
+
+
+def readmodel_path(project_id: uuid.UUID) -> bytes:
+    with Session(engine) as session:
+        return readmodel.ProjectResponse(readmodel.project_public(project_id, session, calculate=True)).body
+
+
+def normalized(body: bytes) -> dict:
+    # The order of the involved members isn't defined on the ORM path
+    project = json.loads(body)
+    for member in project["members"]:
+        for expense in member["expenses"]:
+            expense["involved_members"].sort(key=lambda involved: involved["id"])
+    return project
+
+
+def measure(path, project_id, repeat: int) -> float:
+    path(project_id)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        path(project_id)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.project_read")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    init_db()
+    print(f"{'expenses':>8} {'orm':>10} {'readmodel':>10} {'speedup':>8}")
+    for size in args.sizes:
+        project_id = create_project(size)
+        if normalized(orm_path(project_id)) != normalized(readmodel_path(project_id)):
+            raise RuntimeError(f"The read paths differ for {size} expenses")
+
+        orm = measure(orm_path, project_id, args.repeat)
+        fast = measure(readmodel_path, project_id, args.repeat)
+        print(f"{size:>8} {orm * 1000:>8.2f}ms {fast * 1000:>8.2f}ms {orm / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
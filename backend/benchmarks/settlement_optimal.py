@@ -0,0 +1,116 @@
+# Compare the greedy settlement with the minimum-transfer search of
+# ?calculate=optimal across group sizes, and check the properties of both
+# on random balances: every transfer is positive, the transfers settle all
+# balances exactly, the optimal settlement never needs more transfers than
+# the greedy one, and for small groups it matches an exhaustive search.
+# Exits with status 1 if a check fails.
+#
+#   python -m benchmarks.settlement_optimal --sizes 4 8 12 16 20 30 --runs 20
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from app import settlement
+
+
+def random_balances(rng: random.Random, members: int) -> dict[int, int]:
+    # Real groups often consist of smaller circles sharing expenses, so the
+    # balances are made of clusters of 2 to 4 members that cancel out
+    balances = {}
+    member_id = 0
+    while member_id < members:
+        size = min(rng.randint(2, 4), members - member_id)
+        amounts = [rng.choice((-1, 1)) * rng.randint(1, 500) * 10 for _ in range(size - 1)]
+        amounts.append(-sum(amounts))
+        for amount in amounts:
+            balances[member_id] = amount
+            member_id += 1
+    return balances
+
+
+def minimum_transfers(balances: dict[int, int]) -> int:
+    # Exhaustive search, only feasible for small groups
+    debts = [balance for balance in balances.values() if balance]
+
+    def search(start: int) -> int:
+        while start < len(debts) and not debts[start]:
+            start += 1
+        if start == len(debts):
+            return 0
+        best = len(debts)
+        for other in range(start + 1, len(debts)):
+            if debts[other] * debts[start] < 0:
+                debts[other] += debts[start]
+                best = min(best, 1 + search(start + 1))
+                debts[other] -= debts[start]
+        return best
+
+    return search(0)
+
+
+def check(balances: dict[int, int], transfers: list[settlement.Transfer]) -> str | None:
+    remaining = dict(balances)
+    for from_id, to_id, amount in transfers:
+        if amount <= 0:
+            return f"transfer of {amount} cents"
+        remaining[from_id] += amount
+        remaining[to_id] -= amount
+    if any(remaining.values()):
+        return "balances not settled"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.settlement_optimal")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 12, 16, 20, 30, 100])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=0.2)
+    parser.add_argument("--max-members", type=int, default=20)
+    parser.add_argument("--exhaustive-up-to", type=int, default=9)
+    parser.add_argument("--seed", type=int, default=25)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failures = []
+    print(f"{'members':>7} {'greedy ms':>10} {'optimal ms':>11} {'greedy':>7} {'optimal':>8}")
+    for size in args.sizes:
+        greedy_times, optimal_times = [], []
+        greedy_counts, optimal_counts = [], []
+        for _ in range(args.runs):
+            balances = random_balances(rng, size)
+
+            start = time.perf_counter()
+            greedy = settlement.settle_balances(balances)
+            greedy_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            optimal = settlement.settle_optimal(balances, args.budget, args.max_members)
+            optimal_times.append(time.perf_counter() - start)
+
+            greedy_counts.append(len(greedy))
+            optimal_counts.append(len(optimal))
+
+            for name, transfers in (("greedy", greedy), ("optimal", optimal)):
+                error = check(balances, transfers)
+                if error:
+                    failures.append(f"{name} with {size} members: {error}")
+            if len(optimal) > len(greedy):
+                failures.append(f"optimal with {size} members: {len(optimal)} > {len(greedy)} transfers")
+            if size <= args.exhaustive_up_to and len(optimal) != minimum_transfers(balances):
+                failures.append(f"optimal with {size} members: {len(optimal)} transfers, "
+                                f"minimum is {minimum_transfers(balances)}")
+
+        print(f"{size:>7} {statistics.median(greedy_times) * 1000:>10.3f} "
+              f"{statistics.median(optimal_times) * 1000:>11.3f} "
+              f"{statistics.mean(greedy_counts):>7.1f} {statistics.mean(optimal_counts):>8.1f}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
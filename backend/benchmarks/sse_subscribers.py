@@ -0,0 +1,138 @@
+# Load test of the Server-Sent Events endpoint: open thousands of idle
+# subscribers to a project, measure the memory of the server per connection,
+# then publish a change and time the fan-out to all of them. The server runs
+# with uvicorn in its own process against a fresh SQLite database.
+#
+#   python -m benchmarks.sse_subscribers --subscribers 5000
+#   python -m benchmarks.sse_subscribers --subscribers 2000 --settlement
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def raise_file_limit():
+    # Every subscriber is a socket on both sides
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def run_server(args: argparse.Namespace):
+    import uvicorn
+
+    from app.limiter import limiter
+    from app.main import app
+
+    raise_file_limit()
+    limiter.enabled = False
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", backlog=4096)
+
+
+def rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("No VmRSS in /proc status")
+
+
+async def subscribe(port: int, path: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: benchmark\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    # Headers, then the retry field of the stream
+    await reader.readuntil(b"\r\n\r\n")
+    await reader.readuntil(b"\n\n")
+    return reader, writer
+
+
+async def receive(reader: asyncio.StreamReader):
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise RuntimeError("Stream closed")
+        if b"event: change" in line:
+            return
+
+
+async def run_client(args: argparse.Namespace, pid: int):
+    from httpx import AsyncClient, TransportError
+
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    async with AsyncClient(base_url=base_url) as client:
+        for _ in range(100):
+            try:
+                response = await client.post("/projects", params={"member_count": 4}, json={"name": "benchmark"})
+                break
+            except TransportError:
+                await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("The server didn't start")
+        project = response.json()
+        project_id = project["id"]
+        member_id = project["members"][0]["id"]
+
+        baseline = rss(pid)
+        path = f"/api/projects/{project_id}/events" + ("?settlement=true" if args.settlement else "")
+        start = time.perf_counter()
+        connections = []
+        for offset in range(0, args.subscribers, 500):
+            count = min(500, args.subscribers - offset)
+            connections += await asyncio.gather(*(subscribe(args.port, path) for _ in range(count)))
+        connect_seconds = time.perf_counter() - start
+        # Let the server settle before sampling
+        await asyncio.sleep(1)
+        subscribed = rss(pid)
+
+        start = time.perf_counter()
+        received = asyncio.gather(*(receive(reader) for reader, _ in connections))
+        response = await client.put(f"/projects/{project_id}/members/{member_id}", json={"name": "changed"})
+        response.raise_for_status()
+        await received
+        fanout_seconds = time.perf_counter() - start
+
+        for _, writer in connections:
+            writer.close()
+
+    print(f"{args.subscribers} subscribers connected in {connect_seconds:.2f} s")
+    print(f"server memory: {baseline / 2**20:.1f} MiB idle, {subscribed / 2**20:.1f} MiB subscribed")
+    print(f"memory per subscriber: {(subscribed - baseline) / args.subscribers / 1024:.1f} KiB")
+    print(f"write and fan-out to all subscribers: {fanout_seconds * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sse_subscribers")
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--settlement", action="store_true", help="subscribe with ?settlement=true")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args)
+        return
+
+    raise_file_limit()
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{directory}/benchmark.db",
+            EVENTS_BROADCAST_URL="memory://",
+            EVENTS_KEEPALIVE="3600",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.sse_subscribers", "--serve", "--port", str(args.port)], env=env)
+        try:
+            asyncio.run(run_client(args, server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Measure the startup time of the backend: the import time of the app, and
+# the time from starting the server until the first response, for plain
+# uvicorn and the app.runner supervisor. Every run uses a fresh, migrated
+# SQLite database, so the lifespan takes the path of production.
+#
+#   python -m benchmarks.startup --runs 5 --workers 4
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def migrated_env(directory: str) -> dict[str, str]:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{directory}/benchmark.db")
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, check=True, capture_output=True)
+    return env
+
+
+def import_time(env: dict[str, str]) -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], env=env, check=True,
+                            capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+
+def first_response_time(command: list[str], port: int, env: dict[str, str]) -> float:
+    # Any response counts, the project doesn't exist
+    url = f"http://127.0.0.1:{port}/api/projects/00000000-0000-0000-0000-000000000001"
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < 60:
+            try:
+                urllib.request.urlopen(url, timeout=1)
+            except urllib.error.HTTPError:
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+                continue
+            return time.perf_counter() - start
+        raise RuntimeError(f"No response from {' '.join(command)}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = migrated_env(directory)
+
+        imports = [import_time(env) for _ in range(args.runs)]
+        print(f"{'import app.main':<28} {statistics.median(imports) * 1000:8.1f} ms")
+
+        servers = {
+            "uvicorn": [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1"],
+            "app.runner (1 worker)": [sys.executable, "-m", "app.runner", "--host", "127.0.0.1", "--workers", "1"],
+            f"app.runner ({args.workers} workers)": [
+                sys.executable, "-m", "app.runner", "--host", "127.0.0.1", "--workers", str(args.workers)],
+        }
+        for name, command in servers.items():
+            times = []
+            for _ in range(args.runs):
+                port = free_port()
+                times.append(first_response_time(command + ["--port", str(port)], port, env))
+            print(f"{name:<28} {statistics.median(times) * 1000:8.1f} ms to first response")
+
+
+if __name__ == "__main__":
+    main()
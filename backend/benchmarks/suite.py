@@ -0,0 +1,244 @@
+# Benchmark suite of the API endpoints. Generates seeded projects (see
+# generator.py) in a fresh SQLite database and runs every scenario
+# in-process through the FastAPI TestClient. Reports per scenario:
+#
+#   latency percentiles, throughput, database queries per request and the
+#   peak Python memory of a request (tracemalloc, in a separate pass)
+#
+# The results are written as JSON. Passing the results of an earlier run
+# with --compare flags regressions and exits with status 1.
+#
+#   python -m benchmarks.suite --output baseline.json
+#   python -m benchmarks.suite --output current.json --compare baseline.json
+
+from dataclasses import dataclass, field
+from typing import Callable
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The database has to be set before the database module is imported
+directory = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory.name}/benchmark.db")
+
+from fastapi.testclient import TestClient # noqa: E402
+from sqlalchemy import event # noqa: E402
+from sqlmodel import Session # noqa: E402
+
+from app import helper # noqa: E402
+from app.database import engine # noqa: E402
+from app.limiter import limiter # noqa: E402
+from app.main import app # noqa: E402
+from benchmarks.generator import ProjectSpec, generate_project # noqa: E402
+
+PROFILES = {
+    "small": ProjectSpec(members=4, expenses=10, density=0.7, seed=1),
+    "medium": ProjectSpec(members=8, expenses=100, density=0.5, seed=2),
+    "large": ProjectSpec(members=20, expenses=1000, density=0.3, seed=3),
+}
+
+
+@dataclass
+class Context:
+    client: TestClient
+    project_id: str
+    member_ids: list[str]
+    expense_ids: list[tuple[str, str]]
+    counter: int = 0
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[Context], str]
+    body: Callable[[Context], dict] | None = None
+    # Runs before every request, outside of the measurement
+    setup: Callable[[Context], None] | None = None
+    params: dict = field(default_factory=dict)
+
+
+def next_expense(context: Context) -> tuple[str, str]:
+    context.counter += 1
+    return context.expense_ids[context.counter % len(context.expense_ids)]
+
+
+def project_path(context: Context) -> str:
+    return f"/api/projects/{context.project_id}"
+
+
+def member_path(context: Context) -> str:
+    return f"{project_path(context)}/members/{context.member_ids[0]}"
+
+
+def expense_path(context: Context) -> str:
+    member_id, expense_id = next_expense(context)
+    return f"{project_path(context)}/members/{member_id}/expenses/{expense_id}"
+
+
+def expense_update(context: Context) -> dict:
+    return {"amount": 10 + context.counter % 100, "involved_members": context.member_ids[:2]}
+
+
+SCENARIOS = [
+    Scenario("project", "GET", project_path),
+    Scenario("project_calculate", "GET", project_path, params={"calculate": "true"}),
+    # Without the cached settlement of the project version
+    Scenario("project_calculate_cold", "GET", project_path, params={"calculate": "true"},
+             setup=lambda context: helper.settlement_cache.clear()),
+    Scenario("members", "GET", lambda context: f"{project_path(context)}/members"),
+    Scenario("member_expenses", "GET", lambda context: f"{member_path(context)}/expenses"),
+    Scenario("export_csv", "GET", lambda context: f"{project_path(context)}/expenses/export"),
+    Scenario("expense_create", "POST", lambda context: f"{member_path(context)}/expenses",
+             body=lambda context: {"amount": 12.5, "name": "benchmark"}),
+    Scenario("expense_update", "PUT", expense_path, body=expense_update),
+]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+
+def request(context: Context, scenario: Scenario):
+    if scenario.setup:
+        scenario.setup(context)
+    body = scenario.body(context) if scenario.body else None
+    path = scenario.path(context)
+    start = time.perf_counter()
+    response = context.client.request(scenario.method, path, params=scenario.params, json=body)
+    elapsed = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise RuntimeError(f"{scenario.name}: {response.status_code} {response.text}")
+    return elapsed
+
+
+def run_scenario(context: Context, scenario: Scenario, requests: int, queries: QueryCounter) -> dict:
+    for _ in range(min(5, requests)):
+        request(context, scenario)
+
+    queries.count = 0
+    latencies = [request(context, scenario) for _ in range(requests)]
+    query_count = queries.count / requests
+
+    # Memory in a separate pass, tracemalloc slows down every allocation
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(5, requests)):
+        tracemalloc.reset_peak()
+        request(context, scenario)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "p50_ms": percentiles[49] * 1000,
+        "p90_ms": percentiles[89] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "max_ms": max(latencies) * 1000,
+        "throughput_rps": requests / sum(latencies),
+        "queries_per_request": query_count,
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    limiter.enabled = False
+    queries = QueryCounter()
+    results = {}
+
+    with TestClient(app) as client:
+        for profile in args.profiles:
+            spec = PROFILES[profile]
+            with Session(engine) as session:
+                project_id = generate_project(session, spec)
+            project = client.get(f"/api/projects/{project_id}").json()
+            context = Context(
+                client=client,
+                project_id=project["id"],
+                member_ids=[member["id"] for member in project["members"]],
+                expense_ids=[
+                    (member["id"], expense["id"])
+                    for member in project["members"] for expense in member["expenses"]
+                ],
+            )
+
+            # Writes last, they grow the project
+            for scenario in SCENARIOS:
+                if args.scenarios and scenario.name not in args.scenarios:
+                    continue
+                name = f"{profile}/{scenario.name}"
+                results[name] = run_scenario(context, scenario, args.requests, queries)
+                print(f"{name:<36} p50 {results[name]['p50_ms']:8.2f}ms  "
+                      f"p99 {results[name]['p99_ms']:8.2f}ms  "
+                      f"{results[name]['queries_per_request']:5.1f} queries  "
+                      f"{results[name]['peak_memory_kib']:9.1f} KiB")
+
+    return {
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "profiles": {profile: vars(PROFILES[profile]) for profile in args.profiles},
+        "scenarios": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    # Latency and memory are noisy, so they regress beyond the threshold.
+    # The query count is exact
+    regressions = []
+    for name, result in current["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p90_ms", "peak_memory_kib"):
+            if result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f"{name} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f} "
+                    f"(+{(result[metric] / previous[metric] - 1) * 100:.0f}%)")
+        if result["queries_per_request"] > previous["queries_per_request"]:
+            regressions.append(
+                f"{name} queries_per_request: {previous['queries_per_request']:.1f} -> "
+                f"{result['queries_per_request']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--scenarios", nargs="+", help="only run these scenarios")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative increase of latency or memory flagged as regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
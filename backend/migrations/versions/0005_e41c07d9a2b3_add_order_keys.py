@@ -0,0 +1,82 @@
+"""add order keys
+
+Revision ID: e41c07d9a2b3
+Revises: b893d80d0b5c
+Create Date: 2026-10-18 14:02:31.518204
+
+"""
+from itertools import groupby
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41c07d9a2b3'
+down_revision: Union[str, None] = 'b893d80d0b5c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same keys as app.ordering.index_key, copied so the migration doesn't
+# change with the application code
+def index_key(index: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    key = ""
+    for _ in range(6):
+        index, digit = divmod(index, len(digits))
+        key = digits[digit] + key
+    return key + digits[len(digits) // 2]
+
+
+def backfill(table: str, scope: str) -> None:
+    # Number the entries of every list by their current order, entries
+    # without an order go last
+    entries = sa.table(table, sa.column('id'), sa.column(scope), sa.column('order'), sa.column('order_key'))
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(entries.c.id, entries.c[scope]).order_by(
+            entries.c[scope], entries.c.order.is_(None), entries.c.order, entries.c.id)
+    ).all()
+
+    params = []
+    for _, group in groupby(rows, key=lambda row: row[1]):
+        params.extend({'b_id': row[0], 'b_order_key': index_key(index)} for index, row in enumerate(group))
+    if params:
+        connection.execute(
+            entries.update().where(entries.c.id == sa.bindparam('b_id')).values(order_key=sa.bindparam('b_order_key')),
+            params,
+        )
+
+
+def upgrade() -> None:
+    op.add_column('member', sa.Column('order_key', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True))
+    op.add_column('expense', sa.Column('order_key', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True))
+
+    backfill('member', 'project_id')
+    backfill('expense', 'member_id')
+
+    # Create the new indexes first, InnoDB refuses to drop an index that is
+    # the only one backing a foreign key
+    op.create_index('ix_member_project_id_order_key', 'member', ['project_id', 'order_key'], unique=False)
+    op.create_index('ix_expense_project_id_order_key', 'expense', ['project_id', 'order_key'], unique=False)
+    op.create_index('ix_expense_member_id_order_key', 'expense', ['member_id', 'order_key'], unique=False)
+    op.drop_index('ix_member_project_id_order', table_name='member')
+    op.drop_index('ix_expense_project_id_order', table_name='expense')
+    op.drop_index('ix_expense_member_id_order', table_name='expense')
+
+
+def downgrade() -> None:
+    op.create_index('ix_expense_member_id_order', 'expense', ['member_id', 'order'], unique=False)
+    op.create_index('ix_expense_project_id_order', 'expense', ['project_id', 'order'], unique=False)
+    op.create_index('ix_member_project_id_order', 'member', ['project_id', 'order'], unique=False)
+    op.drop_index('ix_expense_member_id_order_key', table_name='expense')
+    op.drop_index('ix_expense_project_id_order_key', table_name='expense')
+    op.drop_index('ix_member_project_id_order_key', table_name='member')
+
+    with op.batch_alter_table('expense') as batch_op:
+        batch_op.drop_column('order_key')
+    with op.batch_alter_table('member') as batch_op:
+        batch_op.drop_column('order_key')
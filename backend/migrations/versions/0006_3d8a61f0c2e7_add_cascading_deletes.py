@@ -0,0 +1,65 @@
+"""add cascading deletes
+
+Revision ID: 3d8a61f0c2e7
+Revises: e41c07d9a2b3
+Create Date: 2026-10-18 16:47:12.093381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d8a61f0c2e7'
+down_revision: Union[str, None] = 'e41c07d9a2b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, referred table), all referring to the id column
+foreign_keys = [
+    ('member', 'project_id', 'project'),
+    ('expense', 'project_id', 'project'),
+    ('expense', 'member_id', 'member'),
+    ('expensememberlink', 'expense_id', 'expense'),
+    ('expensememberlink', 'member_id', 'member'),
+]
+
+# Names for the unnamed foreign keys of SQLite, which batch mode reflects
+naming_convention = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+}
+
+
+def replace_foreign_key(table: str, column: str, referred: str, ondelete: str | None) -> None:
+    # The existing constraints were created without names, so look up the
+    # name the database gave them. SQLite tables are recreated by batch mode
+    name = f'fk_{table}_{column}_{referred}'
+    existing = [
+        foreign_key['name'] for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table)
+        if foreign_key['constrained_columns'] == [column]
+    ]
+    with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+        if existing:
+            batch_op.drop_constraint(existing[0] or name, type_='foreignkey')
+        batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    # SQLite only accepts foreign keys to unique columns
+    op.create_index('ux_member_id', 'member', ['id'], unique=True)
+    op.create_index('ux_expense_id', 'expense', ['id'], unique=True)
+
+    for table, column, referred in foreign_keys:
+        replace_foreign_key(table, column, referred, 'CASCADE')
+
+
+def downgrade() -> None:
+    for table, column, referred in reversed(foreign_keys):
+        replace_foreign_key(table, column, referred, None)
+
+    op.drop_index('ux_expense_id', table_name='expense')
+    op.drop_index('ux_member_id', table_name='member')
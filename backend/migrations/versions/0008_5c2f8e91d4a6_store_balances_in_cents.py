@@ -0,0 +1,106 @@
+"""store balances in cents
+
+Revision ID: 5c2f8e91d4a6
+Revises: 9b0e4f7a15c3
+Create Date: 2026-10-18 19:12:08.347512
+
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2f8e91d4a6'
+down_revision: Union[str, None] = '9b0e4f7a15c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same rounding and split as app.settlement, copied so the migration
+# doesn't change with the application code
+def to_cents(amount: float | None) -> int:
+    return int(Decimal(str(amount or 0)).scaleb(2).quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def split(amount: int, member_ids: list, seed: int) -> list[tuple]:
+    ids = sorted(member_ids)
+    part, remainder = divmod(amount, len(ids))
+    start = seed % len(ids)
+    return [
+        (member_id, part + (1 if (index - start) % len(ids) < remainder else 0))
+        for index, member_id in enumerate(ids)
+    ]
+
+
+project = sa.table('project', sa.column('id', sa.Uuid()))
+member = sa.table('member', sa.column('id', sa.Uuid()), sa.column('project_id', sa.Uuid()),
+                  sa.column('balance_cents', sa.BigInteger()))
+expense = sa.table('expense', sa.column('id', sa.Uuid()), sa.column('project_id', sa.Uuid()),
+                   sa.column('member_id', sa.Uuid()), sa.column('amount', sa.Float()))
+link = sa.table('expensememberlink', sa.column('expense_id', sa.Uuid()), sa.column('member_id', sa.Uuid()))
+
+
+def recompute_balances() -> None:
+    # The balances were never stored reliably before, so calculate them
+    # from the expenses of every project, one project at a time
+    connection = op.get_bind()
+    project_ids = connection.execute(sa.select(project.c.id)).scalars().all()
+    for project_id in project_ids:
+        member_ids = connection.execute(
+            sa.select(member.c.id).where(member.c.project_id == project_id)).scalars().all()
+        if not member_ids:
+            continue
+
+        involved: dict = {}
+        for expense_id, member_id in connection.execute(
+                sa.select(link.c.expense_id, link.c.member_id)
+                .join(expense, expense.c.id == link.c.expense_id)
+                .where(expense.c.project_id == project_id)):
+            involved.setdefault(expense_id, []).append(member_id)
+
+        balances = dict.fromkeys(member_ids, 0)
+        for expense_id, payer_id, amount in connection.execute(
+                sa.select(expense.c.id, expense.c.member_id, expense.c.amount)
+                .where(expense.c.project_id == project_id)):
+            if payer_id not in balances:
+                continue
+            amount = to_cents(amount)
+            balances[payer_id] += amount
+            for member_id, share in split(amount, involved.get(expense_id) or member_ids, expense_id.int):
+                if member_id in balances:
+                    balances[member_id] -= share
+
+        connection.execute(
+            member.update().where(member.c.id == sa.bindparam('b_id'))
+            .values(balance_cents=sa.bindparam('b_balance')),
+            [{'b_id': member_id, 'b_balance': balance} for member_id, balance in balances.items()],
+        )
+
+
+def upgrade() -> None:
+    op.add_column('member', sa.Column('balance_cents', sa.BigInteger(), server_default='0', nullable=False))
+    recompute_balances()
+    with op.batch_alter_table('member') as batch_op:
+        batch_op.drop_column('balance')
+
+    # Archived members keep the balance they had, in cents
+    op.add_column('member_archive', sa.Column('balance_cents', sa.BigInteger(), server_default='0', nullable=False))
+    op.execute('UPDATE member_archive SET balance_cents = CAST(ROUND(balance * 100) AS BIGINT)')
+    with op.batch_alter_table('member_archive') as batch_op:
+        batch_op.drop_column('balance')
+
+
+def downgrade() -> None:
+    op.add_column('member_archive', sa.Column('balance', sa.Float(), server_default='0', nullable=False))
+    op.execute('UPDATE member_archive SET balance = balance_cents / 100.0')
+    with op.batch_alter_table('member_archive') as batch_op:
+        batch_op.drop_column('balance_cents')
+
+    op.add_column('member', sa.Column('balance', sa.Float(), server_default='0', nullable=False))
+    op.execute('UPDATE member SET balance = balance_cents / 100.0')
+    with op.batch_alter_table('member') as batch_op:
+        batch_op.drop_column('balance_cents')
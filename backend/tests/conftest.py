@@ -0,0 +1,93 @@
+# Tests run against the app in-process, on a temporary SQLite database
+# created from the models. Run inside the backend directory with:
+#
+#   poetry install --with test,async
+#   poetry run pytest
+
+from contextlib import contextmanager
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The database has to be set before the database module is imported
+directory = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{directory.name}/test.db"
+
+from fastapi.testclient import TestClient # noqa: E402
+from sqlalchemy import event # noqa: E402
+from sqlmodel import Session, SQLModel # noqa: E402
+
+from app import database, helper # noqa: E402
+from app.database import engine # noqa: E402
+from app.limiter import limiter # noqa: E402
+from app.main import app # noqa: E402
+
+
+@pytest.fixture(scope="session", params=["sync", "async"])
+def client(request):
+    # The API tests run once with sync sessions in the threadpool and once
+    # with DATABASE_ASYNC=true on aiosqlite, each on an empty database
+    limiter.enabled = False
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    helper.settlement_cache.clear()
+
+    if request.param == "sync":
+        with TestClient(app) as client:
+            yield client
+        return
+
+    pytest.importorskip("aiosqlite")
+    async_engine = database.create_async_database_engine(database.get_async_url(database.DATABASE_URL))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(database, "async_engine", async_engine)
+        with TestClient(app) as client:
+            yield client
+            # The connections belong to the event loop of the client
+            client.portal.call(async_engine.dispose)
+
+
+@pytest.fixture
+def session(client):
+    with Session(engine) as session:
+        yield session
+
+
+def recorded_engines():
+    # The async engine of the async client has an engine of its own
+    return [engine, *([database.async_engine.sync_engine] if database.async_engine else [])]
+
+
+@contextmanager
+def recorded_statements():
+    # Collects the SQL statements sent to the database within the block
+    statements: list[str] = []
+
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    engines = recorded_engines()
+    for recorded in engines:
+        event.listen(recorded, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for recorded in engines:
+            event.remove(recorded, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def database_url():
+    # A separate database file for the migrations
+    with tempfile.TemporaryDirectory() as directory:
+        yield f"sqlite:///{directory}/migrations.db"
+
+
+def alembic(database_url: str, *args: str):
+    subprocess.run([sys.executable, "-m", "alembic", *args], cwd=BACKEND, check=True,
+                   capture_output=True, env=dict(os.environ, DATABASE_URL=database_url))
@@ -0,0 +1,77 @@
+import argparse
+import uuid
+
+from sqlmodel import Session, select
+import pytest
+
+from app import balances, cli, models
+from app.database import engine
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.conftest import recorded_statements
+
+
+def create_project(client, *names: str) -> tuple[str, dict[str, str]]:
+    project_id = client.post("/api/projects", json={"name": "balances"}).json()["id"]
+    member_ids = {
+        name: client.post(f"/api/projects/{project_id}/members", json={"name": name}).json()["id"]
+        for name in names
+    }
+    return project_id, member_ids
+
+
+def payments(client, project_id: str) -> list[tuple[str, str, float]]:
+    project = client.get(f"/api/projects/{project_id}?calculate=true").json()
+    return [
+        (payment["from_member"]["name"], payment["to_member"]["name"], payment["amount"])
+        for payment in project["payments"]
+    ]
+
+
+def test_expense_writes_update_the_balances(client):
+    project_id, member_ids = create_project(client, "A", "B", "C")
+    expense = client.post(f"/api/projects/{project_id}/members/{member_ids['A']}/expenses",
+                          json={"amount": 100, "involved_members": [member_ids["A"], member_ids["B"]]}).json()
+    assert payments(client, project_id) == [("B", "A", 50.0)]
+
+    client.put(f"/api/projects/{project_id}/members/{member_ids['A']}/expenses/{expense['id']}",
+               json={"amount": 30, "involved_members": []})
+    assert sorted(payments(client, project_id)) == [("B", "A", 10.0), ("C", "A", 10.0)]
+
+    client.delete(f"/api/projects/{project_id}/members/{member_ids['A']}/expenses/{expense['id']}")
+    assert payments(client, project_id) == []
+
+
+def test_repair_invalidates_cached_settlements(client):
+    project_id, member_ids = create_project(client, "A", "B")
+    client.post(f"/api/projects/{project_id}/members/{member_ids['A']}/expenses",
+                json={"amount": 10, "involved_members": []})
+    etag = client.get(f"/api/projects/{project_id}?calculate=true").headers["etag"]
+
+    with Session(engine) as session:
+        for member in session.exec(select(models.Member).where(models.Member.project_id == uuid.UUID(project_id))):
+            member.balance_cents = 0
+            session.add(member)
+        session.commit()
+
+    assert cli.verify_balances(argparse.Namespace(repair=True)) == 0
+    response = client.get(f"/api/projects/{project_id}?calculate=true", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert payments(client, project_id) == [("B", "A", 5.0)]
+
+
+@pytest.mark.parametrize("expenses", [10, 1000])
+def test_member_create_applies_deltas_without_loading_the_project(client, expenses):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=10, expenses=expenses, density=0.05, seed=expenses + 4))
+
+    with recorded_statements() as statements:
+        response = client.post(f"/api/projects/{project_id}/members", json={"name": "new"})
+    assert response.status_code == 200
+    # Only the links of the expenses split over everybody are checked
+    assert not [statement for statement in statements if "FROM expensememberlink JOIN" in statement]
+    assert len(statements) <= 8, statements
+
+    with Session(engine) as session:
+        assert balances.recompute_project_balances(project_id, session) == {}
+        new_balance = session.get(models.Member, (uuid.UUID(response.json()["id"]), project_id)).balance_cents
+    assert new_balance < 0
@@ -0,0 +1,48 @@
+import argparse
+import uuid
+
+import pytest
+from sqlmodel import Session, select
+
+from app import balances, cli, models
+from app.database import engine
+from tests.test_balances import create_project
+
+
+@pytest.fixture
+def linked_project(client):
+    # An expense linking a member of another project, which was possible
+    # before the involved members were checked
+    project_id, member_ids = create_project(client, "A", "B")
+    _, other_ids = create_project(client, "C")
+    expense = client.post(f"/api/projects/{project_id}/members/{member_ids['A']}/expenses",
+                          json={"amount": 30, "involved_members": [member_ids["A"], member_ids["B"]]}).json()
+    with Session(engine) as session:
+        session.add(models.ExpenseMemberLink(expense_id=uuid.UUID(expense["id"]), member_id=uuid.UUID(other_ids["C"])))
+        # The balances as migration 0008 calculated them
+        balances.recompute_project_balances(uuid.UUID(project_id), session, repair=True)
+        session.commit()
+    return project_id, member_ids
+
+
+@pytest.mark.parametrize("query", ["", "?calculate=true", "?calculate=optimal"])
+def test_project_detail_shows_members_of_other_projects(client, linked_project, query):
+    project_id, _ = linked_project
+    response = client.get(f"/api/projects/{project_id}{query}")
+    assert response.status_code == 200
+    expense = response.json()["members"][0]["expenses"][0]
+    assert sorted(member["name"] for member in expense["involved_members"]) == ["A", "B", "C"]
+
+
+def test_balances_leave_out_members_of_other_projects(client, linked_project, capsys):
+    project_id, member_ids = linked_project
+    # Split 10/10/10, C's share is not part of the project
+    assert client.post(f"/api/projects/{project_id}/members", json={"name": "D"}).status_code == 200
+    with Session(engine) as session:
+        assert balances.recompute_project_balances(uuid.UUID(project_id), session) == {}
+        stored = {member.name: member.balance_cents for member in session.exec(
+            select(models.Member).where(models.Member.project_id == uuid.UUID(project_id)))}
+    assert stored == {"A": 2000, "B": -1000, "D": 0}
+    # Other tests leave drifted projects behind, only this one is checked
+    cli.verify_balances(argparse.Namespace(repair=False))
+    assert f"project {project_id} " not in capsys.readouterr().out
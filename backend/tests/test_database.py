@@ -0,0 +1,19 @@
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import database
+
+
+def test_routes_run_on_the_session_of_the_mode(client, request, monkeypatch):
+    sessions = []
+    run = database.Database.run
+
+    async def recorded_run(self, fn, *args, **kwargs):
+        sessions.append(type(self.session))
+        return await run(self, fn, *args, **kwargs)
+
+    monkeypatch.setattr(database.Database, "run", recorded_run)
+    project_id = client.post("/api/projects", json={"name": "database"}).json()["id"]
+    assert client.get(f"/api/projects/{project_id}/members").status_code == 200
+
+    mode = request.node.callspec.params["client"]
+    assert sessions and all(issubclass(session, AsyncSession) == (mode == "async") for session in sessions)
@@ -0,0 +1,52 @@
+import uuid
+
+from sqlmodel import Session, func, select
+import pytest
+
+from app import balances, models
+from app.database import engine
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.conftest import recorded_statements
+
+# Independent of the number of expenses: the member delete reads the
+# members, the affected expenses and their links, deletes and updates
+MAX_MEMBER_DELETE_STATEMENTS = 8
+MAX_PROJECT_DELETE_STATEMENTS = 2
+
+
+def count_rows(model, **filters) -> int:
+    with Session(engine) as session:
+        statement = select(func.count()).select_from(model)
+        for column, value in filters.items():
+            statement = statement.where(getattr(model, column) == value)
+        return session.exec(statement).one()
+
+
+@pytest.mark.parametrize("expenses", [10, 2000])
+def test_member_delete_issues_a_constant_number_of_statements(client, expenses):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=20, expenses=expenses, density=0.3, seed=expenses))
+    member_id = uuid.UUID(client.get(f"/api/projects/{project_id}/members").json()[0]["id"])
+
+    with recorded_statements() as statements:
+        client.delete(f"/api/projects/{project_id}/members/{member_id}").raise_for_status()
+    assert len(statements) <= MAX_MEMBER_DELETE_STATEMENTS, statements
+    assert not count_rows(models.Expense, member_id=member_id)
+    assert not count_rows(models.ExpenseMemberLink, member_id=member_id)
+
+    # The stored balances match a full recalculation
+    with Session(engine) as session:
+        assert balances.recompute_project_balances(project_id, session) == {}
+
+
+@pytest.mark.parametrize("expenses", [10, 2000])
+def test_project_delete_issues_a_constant_number_of_statements(client, expenses):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=20, expenses=expenses, seed=expenses + 1))
+
+    with recorded_statements() as statements:
+        client.delete(f"/api/projects/{project_id}").raise_for_status()
+    assert len(statements) <= MAX_PROJECT_DELETE_STATEMENTS, statements
+    assert not count_rows(models.Member, project_id=project_id)
+    assert not count_rows(models.Expense, project_id=project_id)
+    assert client.get(f"/api/projects/{project_id}").status_code == 404
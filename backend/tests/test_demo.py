@@ -0,0 +1,30 @@
+import uuid
+
+import pytest
+
+from app import middlewares
+
+
+@pytest.fixture
+def demo_project(client, monkeypatch):
+    project_id = uuid.UUID(client.post("/api/projects", json={"name": "demo"}).json()["id"])
+    monkeypatch.setattr(middlewares, "demo_project_id", project_id)
+    return project_id
+
+
+@pytest.mark.parametrize("spelling", [str, lambda id: id.hex, lambda id: str(id).upper(),
+                                      lambda id: f"{{{id}}}", lambda id: f"urn:uuid:{id}"])
+def test_demo_project_is_read_only_in_every_spelling(client, demo_project, spelling):
+    path = f"/api/projects/{spelling(demo_project)}"
+    assert client.put(path, json={"name": "renamed"}).status_code == 403
+    assert client.post(f"{path}/members", json={"name": "A"}).status_code == 403
+    assert client.delete(path).status_code == 403
+
+    project = client.get(f"/api/projects/{demo_project}").json()
+    assert project["name"] == "demo"
+    assert project["members"] == []
+
+
+def test_other_projects_stay_writable(client, demo_project):
+    project_id = client.post("/api/projects", json={"name": "other"}).json()["id"]
+    assert client.put(f"/api/projects/{project_id}", json={"name": "renamed"}).status_code == 200
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import uuid
+
+from sqlmodel import Session
+
+from app import events
+from app.database import engine
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.conftest import recorded_statements
+
+
+def drain(subscriber: events.Subscriber) -> list[dict | None]:
+    messages = []
+    while not subscriber.queue.empty():
+        message = subscriber.queue.get_nowait()
+        messages.append(message and json.loads(message.split("data: ", 1)[1]))
+    return messages
+
+
+def test_deleted_event_is_delivered_before_the_end():
+    hub = events.Hub()
+    project_id = uuid.uuid4()
+    subscriber = hub.subscribe(project_id)
+
+    async def dispatch():
+        await hub.dispatch({"type": "expense.deleted", "project_id": str(project_id), "data": None})
+        await hub.dispatch({"type": "project.deleted", "project_id": str(project_id), "data": None})
+    asyncio.run(dispatch())
+
+    messages = drain(subscriber)
+    assert [message and message["type"] for message in messages] == ["expense.deleted", "project.deleted", None]
+    assert hub.count() == 0
+
+
+def test_slow_subscribers_are_ended():
+    hub = events.Hub()
+    project_id = uuid.uuid4()
+    subscriber = hub.subscribe(project_id)
+
+    async def dispatch():
+        for _ in range(events.EVENTS_QUEUE_SIZE + 1):
+            await hub.dispatch({"type": "expense.created", "project_id": str(project_id), "data": None})
+    asyncio.run(dispatch())
+
+    assert drain(subscriber) == [None]
+    assert hub.dropped == 1
+
+
+def test_payments_only_load_the_members(client):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=4, expenses=200, seed=15))
+    with recorded_statements() as statements:
+        payments = events.load_payments(project_id)
+    assert payments
+    assert len(statements) <= 2
+    assert not any("FROM expense" in statement for statement in statements)
+    assert events.load_payments(uuid.uuid4()) is None
@@ -0,0 +1,59 @@
+import uuid
+
+from sqlalchemy import create_engine, text
+
+from tests.conftest import alembic
+
+
+def test_upgrade_calculates_balances_of_existing_projects(database_url):
+    # A project of an installation at revision 0001, where A paid 100.00
+    # split with B, and B paid 0.10 for everybody
+    alembic(database_url, "upgrade", "696a16b17fb9")
+    project_id, member_a, member_b, expense_1, expense_2 = (uuid.uuid4().hex for _ in range(5))
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO project (id, name, created_at, updated_at) "
+            "VALUES (:id, 'migrated', '2025-01-01', '2025-01-01')"), {"id": project_id})
+        connection.execute(text(
+            "INSERT INTO member (id, project_id, name, balance, \"order\") VALUES (:id, :project_id, :name, 0, 0)"),
+            [{"id": member_a, "project_id": project_id, "name": "A"},
+             {"id": member_b, "project_id": project_id, "name": "B"}])
+        connection.execute(text(
+            "INSERT INTO expense (id, project_id, member_id, amount, name, \"order\") "
+            "VALUES (:id, :project_id, :member_id, :amount, 'expense', 0)"),
+            [{"id": expense_1, "project_id": project_id, "member_id": member_a, "amount": 100},
+             {"id": expense_2, "project_id": project_id, "member_id": member_b, "amount": 0.1}])
+        connection.execute(text(
+            "INSERT INTO expensememberlink (expense_id, member_id) VALUES (:expense_id, :member_id)"),
+            [{"expense_id": expense_1, "member_id": member_a},
+             {"expense_id": expense_1, "member_id": member_b}])
+
+    alembic(database_url, "upgrade", "head")
+    with engine.connect() as connection:
+        balances = dict(connection.execute(text("SELECT name, balance_cents FROM member")).all())
+    engine.dispose()
+    # The 10 cents are split 5/5
+    assert balances == {"A": 4995, "B": -4995}
+
+
+def test_upgrade_converts_archived_balances_and_matches_the_models(database_url):
+    alembic(database_url, "upgrade", "9b0e4f7a15c3")
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO member_archive (id, project_id, name, balance, archived_at) "
+            "VALUES (:id, :project_id, 'A', -12.34, '2025-01-01')"),
+            {"id": uuid.uuid4().hex, "project_id": uuid.uuid4().hex})
+
+    alembic(database_url, "upgrade", "head")
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT balance_cents FROM member_archive")).scalar_one() == -1234
+    engine.dispose()
+    # Fails if the migrated schema differs from the models
+    alembic(database_url, "check")
+
+    alembic(database_url, "downgrade", "9b0e4f7a15c3")
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT balance FROM member_archive")).scalar_one() == -12.34
+    engine.dispose()
@@ -0,0 +1,87 @@
+from sqlmodel import Session, select
+import pytest
+import uuid
+
+from app import models, ordering
+from app.database import engine
+from tests.conftest import recorded_statements
+
+
+def test_key_between_keeps_keys_short_on_appends():
+    key = None
+    for _ in range(1000):
+        next_key = ordering.key_between(key, None)
+        assert key is None or key < next_key
+        key = next_key
+    assert len(key) <= 32
+
+
+def test_members_created_together_get_distinct_keys(client):
+    project = client.post("/api/projects?member_count=3", json={"name": "ordering"}).json()
+    project_id = project["id"]
+    with Session(engine) as session:
+        keys = session.exec(select(models.Member.order_key).where(
+            models.Member.project_id == uuid.UUID(project_id))).all()
+    assert len(set(keys)) == 3
+    with recorded_statements() as statements:
+        client.post(f"/api/projects/{project_id}/batch", json={"operations": [
+            {"op": "create", "type": "member", "id": "a", "data": {"name": "A"}},
+            {"op": "create", "type": "member", "id": "b", "data": {"name": "B"}},
+            {"op": "create", "type": "expense", "member_id": "a", "data": {"name": "1", "amount": 1}},
+            {"op": "create", "type": "expense", "member_id": "a", "data": {"name": "2", "amount": 2}},
+        ]}).raise_for_status()
+    assert sum("max(member.order_key)" in statement for statement in statements) == 1
+    assert not any("max(expense.order_key)" in statement for statement in statements)
+
+    members = client.get(f"/api/projects/{project_id}").json()["members"]
+    assert [member["name"] for member in members] == [None, None, None, "A", "B"]
+    assert [expense["name"] for expense in members[3]["expenses"]] == ["1", "2"]
+
+    # Moving to the end of the list doesn't need a rebalance
+    member_ids = [member["id"] for member in members]
+    client.put(f"/api/projects/{project_id}/members/{member_ids[0]}/move",
+               json={"after": member_ids[-1]}).raise_for_status()
+    members = client.get(f"/api/projects/{project_id}").json()["members"]
+    assert [member["id"] for member in members] == member_ids[1:] + member_ids[:1]
+
+
+def test_repeated_imports_keep_the_keys_short(client):
+    project_id = client.post("/api/projects?member_count=1", json={"name": "imports"}).json()["id"]
+    member_id = client.get(f"/api/projects/{project_id}/members").json()[0]["id"]
+    for index in range(12):
+        client.post(f"/api/projects/{project_id}/expenses/import", content=f'{{"payer": "{member_id}", "amount": {index}}}\n',
+                    headers={"Content-Type": "application/x-ndjson"}).raise_for_status()
+
+    with Session(engine) as session:
+        keys = session.exec(select(models.Expense.order_key).where(
+            models.Expense.member_id == uuid.UUID(member_id)).order_by(models.Expense.order_key)).all()
+    assert len(set(keys)) == 12
+    assert max(len(key) for key in keys) <= ordering.INDEX_WIDTH + 1
+    amounts = [expense["amount"] for expense in client.get(f"/api/projects/{project_id}/members/{member_id}/expenses").json()]
+    assert amounts == list(range(12))
+
+
+@pytest.mark.parametrize("order", [-1, ordering.MAX_INDEX])
+def test_orders_outside_the_order_keys_are_rejected(client, order):
+    project_id = client.post("/api/projects?member_count=1", json={"name": "orders"}).json()["id"]
+    member_id = client.get(f"/api/projects/{project_id}/members").json()[0]["id"]
+    member_path = f"/api/projects/{project_id}/members/{member_id}"
+    expense_id = client.post(f"{member_path}/expenses", json={"amount": 1}).json()["id"]
+
+    assert client.post(f"/api/projects/{project_id}/members", json={"order": order}).status_code == 422
+    assert client.put(member_path, json={"order": order}).status_code == 422
+    assert client.post(f"{member_path}/expenses", json={"amount": 1, "order": order}).status_code == 422
+    assert client.put(f"{member_path}/expenses/{expense_id}", json={"order": order}).status_code == 422
+    assert client.post(f"/api/projects/{project_id}/expenses/import",
+                       content=f'{{"payer": "{member_id}", "amount": 1, "order": {order}}}\n',
+                       headers={"content-type": "application/x-ndjson"}).status_code == 422
+    assert client.post(f"/api/projects/{project_id}/batch", json={"operations": [
+        {"op": "create", "type": "member", "data": {"order": order}}]}).status_code == 422
+
+
+def test_largest_order_gets_the_last_index_key(client):
+    project_id = client.post("/api/projects", json={"name": "orders"}).json()["id"]
+    member = client.post(f"/api/projects/{project_id}/members",
+                         json={"order": ordering.MAX_INDEX - 1}).json()
+    with Session(engine) as session:
+        assert session.get(models.Member, (uuid.UUID(member["id"]), uuid.UUID(project_id))).order_key == "zzzzzzi"
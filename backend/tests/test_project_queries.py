@@ -0,0 +1,72 @@
+from sqlmodel import Session
+import pytest
+
+from app import helper, models
+from app.database import engine
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.conftest import recorded_statements
+
+# Project sizes from a few rows to a large project
+SPECS = [
+    ProjectSpec(members=2, expenses=5, seed=1),
+    ProjectSpec(members=10, expenses=100, seed=2),
+    ProjectSpec(members=30, expenses=500, seed=3),
+]
+
+
+@pytest.fixture(scope="module")
+def project_ids(client):
+    with Session(engine) as session:
+        return [generate_project(session, spec) for spec in SPECS]
+
+
+@pytest.mark.parametrize("path", ["", "?calculate=true", "?calculate=optimal"])
+def test_project_detail_query_count_is_constant(client, project_ids, path):
+    counts = []
+    for project_id in project_ids:
+        with recorded_statements() as statements:
+            response = client.get(f"/api/projects/{project_id}{path}")
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert len(set(counts)) == 1, counts
+
+
+def test_project_graph_query_count_is_constant(project_ids):
+    counts = []
+    for project_id in project_ids:
+        with Session(engine) as session:
+            with recorded_statements() as statements:
+                project = helper.get_project_or_404(project_id, session)
+                public = models.ProjectPublic.model_validate(project)
+        assert sum(len(member.expenses) for member in public.members) > 0
+        counts.append(len(statements))
+    assert len(set(counts)) == 1, counts
+
+
+def test_project_detail_is_ordered(client, project_ids):
+    project = client.get(f"/api/projects/{project_ids[-1]}").json()
+    orders = [member["order"] for member in project["members"]]
+    assert orders == sorted(orders)
+    for member in project["members"]:
+        orders = [expense["order"] for expense in member["expenses"]]
+        assert orders == sorted(orders)
+
+
+def test_project_update_bumps_the_version_and_loads_the_graph_once(client):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=5, expenses=50, seed=5))
+        version = helper.get_project_version_or_404(project_id, session)
+    etag = client.get(f"/api/projects/{project_id}").headers["etag"]
+
+    with recorded_statements() as statements:
+        response = client.put(f"/api/projects/{project_id}", json={"name": "renamed"})
+    assert response.status_code == 200
+    assert response.json()["name"] == "renamed"
+    assert sum(len(member["expenses"]) for member in response.json()["members"]) == 50
+    # The involved members are the last level of the graph
+    graph_loads = [statement for statement in statements if "FROM expensememberlink" in statement]
+    assert len(graph_loads) == 1, graph_loads
+
+    with Session(engine) as session:
+        assert helper.get_project_version_or_404(project_id, session) == version + 1
+    assert client.get(f"/api/projects/{project_id}").headers["etag"] != etag
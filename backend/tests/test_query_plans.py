@@ -0,0 +1,58 @@
+from sqlalchemy import event
+from sqlmodel import Session
+import pytest
+
+from app.database import engine
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.conftest import recorded_engines
+
+
+@pytest.fixture(scope="module")
+def project(client):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=5, expenses=50, seed=9))
+    project = client.get(f"/api/projects/{project_id}").json()
+    member = next(member for member in project["members"] if member["expenses"])
+    return project_id, member["id"], member["expenses"][0]["id"]
+
+
+def query_plans(client, path: str) -> list[tuple[str, list[str]]]:
+    # Plans of all SELECT statements of a request
+    queries = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            queries.append((statement, parameters))
+
+    engines = recorded_engines()
+    for recorded in engines:
+        event.listen(recorded, "before_cursor_execute", record)
+    try:
+        assert client.get(path).status_code == 200
+    finally:
+        for recorded in engines:
+            event.remove(recorded, "before_cursor_execute", record)
+
+    with engine.connect() as connection:
+        return [
+            (statement, [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)])
+            for statement, parameters in queries
+        ]
+
+
+@pytest.mark.parametrize("path", [
+    "/api/projects/{project_id}",
+    "/api/projects/{project_id}?calculate=true",
+    "/api/projects/{project_id}/members",
+    "/api/projects/{project_id}/members/{member_id}",
+    "/api/projects/{project_id}/members/{member_id}/expenses",
+    "/api/projects/{project_id}/members/{member_id}/expenses/{expense_id}",
+])
+def test_hot_queries_use_an_index(client, project, path):
+    project_id, member_id, expense_id = project
+    plans = query_plans(client, path.format(project_id=project_id, member_id=member_id, expense_id=expense_id))
+    assert plans
+    for statement, plan in plans:
+        for detail in plan:
+            # SEARCH uses an index, SCAN reads a whole table
+            assert not (detail.startswith("SCAN") and "INDEX" not in detail), (statement, plan)
@@ -0,0 +1,105 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from fastapi import FastAPI, Request
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+from slowapi.errors import RateLimitExceeded
+import httpx
+import pytest
+
+from app.limiter import RATELIMIT_STRATEGY, ThreadedLimiter, custom_handler
+
+
+@pytest.fixture
+def sqlite_uri(tmp_path):
+    return f"sqlite:///{tmp_path}/ratelimit.db"
+
+
+@pytest.fixture
+def sqlite_storage(sqlite_uri):
+    return lambda: storage_from_string(sqlite_uri)
+
+
+@pytest.fixture
+def redis_storage():
+    # An in-process Redis stand-in: every storage gets a connection pool
+    # of its own to the same server, as workers connecting to Redis would
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = pytest.importorskip("redis")
+    server = fakeredis.FakeServer()
+    return lambda: storage_from_string(
+        "redis://localhost:6379",
+        connection_pool=redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=server))
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def storages(request):
+    # Two storages, as two worker processes would connect
+    storage = request.getfixturevalue(f"{request.param}_storage")
+    return [storage(), storage()]
+
+
+def test_workers_share_the_counters(storages):
+    limit = parse("5/minute")
+    workers = [SlidingWindowCounterRateLimiter(storage) for storage in storages]
+    hits = [workers[index % 2].hit(limit, "client") for index in range(8)]
+    assert hits == [True] * 5 + [False] * 3
+    assert not workers[0].hit(limit, "client")
+    assert workers[1].hit(limit, "other client")
+
+
+def test_concurrent_workers_never_exceed_the_limit(storages):
+    limit = parse("20/minute")
+    workers = [SlidingWindowCounterRateLimiter(storage) for storage in storages]
+    hits = []
+
+    def hit(worker):
+        for _ in range(20):
+            hits.append(worker.hit(limit, "client"))
+
+    threads = [threading.Thread(target=hit, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert hits.count(True) == 20
+
+
+def test_blocked_storage_doesnt_block_the_event_loop(sqlite_uri):
+    limiter = ThreadedLimiter(key_func=lambda request: "client", storage_uri=sqlite_uri,
+                              strategy=RATELIMIT_STRATEGY, storage_options={"timeout": 5})
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, custom_handler)
+
+    @app.get("/limited")
+    @limiter.limit("1/minute")
+    async def limited(request: Request):
+        return {}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/limited")).status_code == 200
+
+            # Another worker holds the write lock of the counters
+            other = sqlite3.connect(sqlite_uri.removeprefix("sqlite:///"), isolation_level=None)
+            other.execute("BEGIN IMMEDIATE")
+            request = asyncio.create_task(client.get("/limited"))
+            start = time.perf_counter()
+            ticks = 0
+            while time.perf_counter() - start < 0.5:
+                await asyncio.sleep(0.01)
+                ticks += 1
+            assert not request.done()
+            other.execute("ROLLBACK")
+            other.close()
+
+            assert (await request).status_code == 429
+            return ticks
+
+    # The loop keeps running while the check waits for the lock
+    assert asyncio.run(run()) > 20
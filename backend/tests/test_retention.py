@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, event, func, select, update
+from sqlmodel import Session
+
+from app import database, models, retention
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.conftest import alembic
+
+ARCHIVED_TABLES = [
+    (models.Project.__table__, models.project_archive),
+    (models.Member.__table__, models.member_archive),
+    (models.Expense.__table__, models.expense_archive),
+    (models.ExpenseMemberLink.__table__, models.expensememberlink_archive),
+]
+
+
+def count_rows(session: Session, table) -> int:
+    return session.execute(select(func.count()).select_from(table)).scalar_one()
+
+
+def test_archive_moves_stale_projects_of_a_migrated_database(database_url, monkeypatch):
+    # The archive tables as created by the migrations, not by the models
+    alembic(database_url, "upgrade", "head")
+    engine = create_engine(database_url)
+    event.listen(engine, "connect", database.set_sqlite_pragmas)
+    monkeypatch.setattr(retention, "engine", engine)
+
+    with Session(engine) as session:
+        stale_ids = [generate_project(session, ProjectSpec(members=4, expenses=20, seed=seed)) for seed in (1, 2, 3)]
+        demo_id = generate_project(session, ProjectSpec(members=3, expenses=10, seed=4))
+        fresh_id = generate_project(session, ProjectSpec(members=3, expenses=10, seed=5))
+        session.execute(update(models.Project).where(models.Project.id != fresh_id).values(
+            updated_at=datetime.now(timezone.utc) - timedelta(days=30)))
+        session.commit()
+        live_rows = {table.name: count_rows(session, table) for table, _ in ARCHIVED_TABLES}
+    monkeypatch.setattr(retention, "demo_project_id", demo_id)
+
+    report = retention.purge_stale_projects(days=7, archive=True, batch_size=2, pause=0)
+
+    assert report.projects == len(stale_ids)
+    with Session(engine) as session:
+        remaining = set(session.execute(select(models.Project.id)).scalars())
+        assert remaining == {demo_id, fresh_id}
+        archived = set(session.execute(select(models.project_archive.c.id)).scalars())
+        assert archived == set(stale_ids)
+        # Every row of the stale projects is moved, none is copied twice
+        moved = 0
+        for table, archive_table in ARCHIVED_TABLES:
+            rows = count_rows(session, archive_table)
+            assert rows == live_rows[table.name] - count_rows(session, table)
+            assert rows
+            moved += rows
+        assert report.rows == moved
+    engine.dispose()
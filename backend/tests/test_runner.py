@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from app import runner
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    # Restored after every test, also if the runner sets a default
+    for name in ("RATELIMIT_STORAGE_URI", "EVENTS_BROADCAST_URL"):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+
+
+def test_single_worker_keeps_the_defaults():
+    runner.configure_shared_state(1)
+    assert "RATELIMIT_STORAGE_URI" not in os.environ
+
+
+def test_multiple_workers_need_a_shared_broadcast():
+    with pytest.raises(SystemExit):
+        runner.configure_shared_state(2)
+
+
+def test_multiple_workers_share_the_rate_limits(monkeypatch):
+    monkeypatch.setenv("EVENTS_BROADCAST_URL", "redis://localhost:6379")
+    runner.configure_shared_state(2)
+    assert os.environ["RATELIMIT_STORAGE_URI"].startswith("sqlite://")
+
+    monkeypatch.setenv("RATELIMIT_STORAGE_URI", "memory://")
+    with pytest.raises(SystemExit):
+        runner.configure_shared_state(2)
@@ -0,0 +1,80 @@
+import random
+import time
+
+import pytest
+
+from app import settlement
+from benchmarks.settlement_optimal import check, minimum_transfers, random_balances
+
+
+@pytest.mark.parametrize("members", [2, 3, 5, 8, 9])
+def test_optimal_settlement_needs_the_minimum_number_of_transfers(members):
+    rng = random.Random(members)
+    for _ in range(30):
+        balances = random_balances(rng, members)
+        greedy = settlement.settle_balances(balances)
+        optimal = settlement.settle_optimal(balances)
+
+        assert check(balances, greedy) is None
+        assert check(balances, optimal) is None
+        assert len(optimal) <= len(greedy)
+        assert len(optimal) == minimum_transfers(balances)
+
+
+@pytest.mark.parametrize("members", [12, 20, 40])
+def test_settlements_balance_out_exactly(members):
+    rng = random.Random(members)
+    for _ in range(10):
+        balances = random_balances(rng, members)
+        greedy = settlement.settle_balances(balances)
+        optimal = settlement.settle_optimal(balances)
+
+        assert check(balances, greedy) is None
+        assert check(balances, optimal) is None
+        assert len(optimal) <= len(greedy)
+
+
+def test_split_distributes_every_cent():
+    rng = random.Random(25)
+    for _ in range(200):
+        amount = rng.randint(0, 100_000)
+        member_ids = rng.sample(range(50), rng.randint(1, 12))
+        shares = dict(settlement.split(amount, member_ids, seed=rng.getrandbits(64)))
+
+        assert sum(shares.values()) == amount
+        assert max(shares.values()) - min(shares.values()) <= 1
+
+
+# Groups of three members whose balances cancel out, without opposite
+# pairs, so every member is searched and the optimal settlement needs
+# fewer transfers than the greedy one
+def grouped_balances(groups: int) -> dict[int, int]:
+    balances = {}
+    for group in range(groups):
+        first, second = 100 + 50 * group, 300 - 20 * group
+        balances[3 * group] = first
+        balances[3 * group + 1] = second
+        balances[3 * group + 2] = -first - second
+    return balances
+
+
+def test_optimal_falls_back_beyond_max_members():
+    balances = grouped_balances(4)
+    assert len(settlement.settle_optimal(balances)) < len(settlement.settle_balances(balances))
+    assert settlement.settle_optimal(balances, max_members=4) == settlement.settle_balances(balances)
+
+
+def test_optimal_falls_back_when_the_budget_is_spent():
+    balances = grouped_balances(4)
+    assert len(settlement.settle_optimal(balances)) < len(settlement.settle_balances(balances))
+    assert settlement.settle_optimal(balances, budget=0) == settlement.settle_balances(balances)
+
+
+def test_budget_counts_only_the_cpu_time_of_the_calling_thread(monkeypatch):
+    # The CPU time of other threads shows up in process_time only
+    clock = iter(range(1000))
+    monkeypatch.setattr(time, "process_time", lambda: 0)
+    monkeypatch.setattr(time, "thread_time", lambda: next(clock))
+
+    balances = grouped_balances(4)
+    assert settlement.settle_optimal(balances, budget=0.5) == settlement.settle_balances(balances)
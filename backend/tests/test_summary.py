@@ -0,0 +1,29 @@
+from sqlmodel import Session
+
+from app.database import engine
+from benchmarks.generator import ProjectSpec, generate_project
+from tests.test_balances import create_project
+
+
+def test_summary_settles_the_same_amounts_as_calculate(client):
+    with Session(engine) as session:
+        project_id = generate_project(session, ProjectSpec(members=12, expenses=300, density=0.4, seed=24))
+    summary = client.get(f"/api/projects/{project_id}/summary").json()
+    project = client.get(f"/api/projects/{project_id}?calculate=true").json()
+
+    assert summary["payments"] == project["payments"]
+    for member in summary["members"]:
+        assert round(member["paid"] - member["owed"], 2) == member["balance"]
+
+
+def test_summary_splits_uneven_amounts_in_cents(client):
+    # 0.10 split three ways: one member owes a cent more than the others
+    project_id, member_ids = create_project(client, "A", "B", "C")
+    client.post(f"/api/projects/{project_id}/members/{member_ids['A']}/expenses",
+                json={"amount": 0.1, "involved_members": []})
+    summary = client.get(f"/api/projects/{project_id}/summary").json()
+
+    members = {member["name"]: member for member in summary["members"]}
+    assert members["A"]["paid"] == 0.1
+    assert sorted(member["owed"] for member in members.values()) == [0.03, 0.03, 0.04]
+    assert sum(payment["amount"] for payment in summary["payments"]) == round(0.1 - members["A"]["owed"], 2)